@@ -0,0 +1,74 @@
+import subprocess
+
+from detect_changes import detect_changes
+
+
+def _git(repo, *args) -> str:
+    result = subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        capture_output=True, text=True, check=True,
+    )
+    return result.stdout.strip()
+
+
+def _repo(path, commits: int = 1) -> str:
+    """A repo with the given number of commits, returning the commit HEAD points to"""
+    path.mkdir(parents=True)
+    _git(path, "init", "-q")
+    for i in range(commits):
+        _git(path, "commit", "-q", "--allow-empty", "-m", f"commit {i}")
+    return _git(path, "rev-parse", "HEAD")
+
+
+def _clone(source, path) -> str:
+    subprocess.run(["git", "clone", "-q", str(source), str(path)], check=True)
+    return _git(path, "rev-parse", "HEAD")
+
+
+def _detect(tmp_path, entries):
+    return detect_changes(
+        entries,
+        upstream_url=f"file://{tmp_path}/upstream/{{feedstock}}",
+        fork_url=f"file://{tmp_path}/fork/{{feedstock}}",
+        workers=4,
+        timeout=30,
+        retries=0,
+    )
+
+
+def test_unchanged(tmp_path):
+    upstream = _repo(tmp_path / "upstream" / "a-feedstock")
+    _clone(tmp_path / "upstream" / "a-feedstock", tmp_path / "fork" / "a-feedstock")
+    assert _detect(tmp_path, {"a-feedstock": {"commit": upstream}}) == {"changed": [], "commits": {}, "errors": {}}
+
+
+def test_upstream_moved(tmp_path):
+    _repo(tmp_path / "upstream" / "a-feedstock")
+    old = _clone(tmp_path / "upstream" / "a-feedstock", tmp_path / "fork" / "a-feedstock")
+    _git(tmp_path / "upstream" / "a-feedstock", "commit", "-q", "--allow-empty", "-m", "update")
+    new = _git(tmp_path / "upstream" / "a-feedstock", "rev-parse", "HEAD")
+    # b is in sync with its fork, but not with the commit in the manifest
+    b = _repo(tmp_path / "upstream" / "b-feedstock", 2)
+    _clone(tmp_path / "upstream" / "b-feedstock", tmp_path / "fork" / "b-feedstock")
+    assert _detect(tmp_path, {"a-feedstock": {"commit": old}, "b-feedstock": {"commit": old}}) == {
+        "changed": ["a-feedstock", "b-feedstock"],
+        "commits": {"a-feedstock": new, "b-feedstock": b},
+        "errors": {},
+    }
+
+
+def test_missing_repo(tmp_path):
+    upstream = _repo(tmp_path / "upstream" / "a-feedstock")
+    _clone(tmp_path / "upstream" / "a-feedstock", tmp_path / "fork" / "a-feedstock")
+    # c has an upstream repo but was never forked
+    _repo(tmp_path / "upstream" / "c-feedstock")
+    result = _detect(tmp_path, {
+        "a-feedstock": {"commit": upstream},
+        "b-feedstock": {"commit": upstream},
+        "c-feedstock": {"commit": upstream},
+    })
+    assert result["changed"] == []
+    assert result["commits"] == {}
+    assert sorted(result["errors"]) == ["b-feedstock", "c-feedstock"]
+    assert f"{tmp_path}/upstream/b-feedstock" in result["errors"]["b-feedstock"]
+    assert f"{tmp_path}/fork/c-feedstock" in result["errors"]["c-feedstock"]
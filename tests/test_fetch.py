@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from fetch import ConditionalFetcher
+
+URL = "https://example.com/conda-forge/a-feedstock/main/recipe/meta.yaml"
+
+
+class _Response:
+    def __init__(self, status_code, text="", headers=None, reason="OK"):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.reason = reason
+
+
+class _Session:
+    """Answers from a list of responses, recording the headers of every request"""
+
+    def __init__(self, *responses, delay=0.0):
+        self.responses = list(responses)
+        self.requests = []
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, allow_redirects=True):
+        time.sleep(self.delay)
+        with self._lock:
+            self.requests.append((url, dict(headers or {})))
+            response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_revalidate_on_next_run(tmp_path):
+    headers = {"ETag": 'W/"abc"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    session = _Session(_Response(200, "recipe", headers))
+    fetcher = ConditionalFetcher(session, str(tmp_path))
+    response = fetcher.get(URL)
+    assert (response.status_code, response.text, response.not_modified) == (200, "recipe", False)
+    assert response.etag == 'W/"abc"'
+    assert session.requests == [(URL, {})]
+    fetcher.save()
+    with open(tmp_path / "index.json") as f:
+        assert json.load(f) == {URL: {"etag": 'W/"abc"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}}
+
+    # The next run sends the validators and gets the body from the cache on a 304
+    session = _Session(_Response(304, reason="Not Modified"))
+    fetcher = ConditionalFetcher(session, str(tmp_path))
+    response = fetcher.get(URL)
+    assert session.requests == [
+        (URL, {"If-None-Match": 'W/"abc"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    ]
+    assert (response.status_code, response.text, response.not_modified) == (200, "recipe", True)
+    assert response.etag == 'W/"abc"'
+    assert fetcher.stats() == {"requests": 1, "saved": 0, "not_modified": 1}
+
+
+def test_changed_on_next_run(tmp_path):
+    fetcher = ConditionalFetcher(_Session(_Response(200, "old", {"ETag": '"1"'})), str(tmp_path))
+    fetcher.get(URL)
+    fetcher.save()
+
+    session = _Session(_Response(200, "new", {"ETag": '"2"'}))
+    fetcher = ConditionalFetcher(session, str(tmp_path))
+    assert fetcher.get(URL).text == "new"
+    assert session.requests == [(URL, {"If-None-Match": '"1"'})]
+    fetcher.save()
+    with open(tmp_path / "index.json") as f:
+        assert json.load(f)[URL]["etag"] == '"2"'
+
+
+def test_no_validators_without_body(tmp_path):
+    fetcher = ConditionalFetcher(_Session(_Response(200, "recipe", {"ETag": '"1"'})), str(tmp_path))
+    fetcher.get(URL)
+    fetcher.save()
+    for name in os.listdir(tmp_path):
+        if name != "index.json":
+            os.remove(tmp_path / name)
+
+    # A 304 would be useless without the body, so it is requested in full
+    session = _Session(_Response(200, "recipe", {"ETag": '"1"'}))
+    ConditionalFetcher(session, str(tmp_path)).get(URL)
+    assert session.requests == [(URL, {})]
+
+
+def test_once_per_run():
+    session = _Session(_Response(200, "recipe"), _Response(404, reason="Not Found"))
+    fetcher = ConditionalFetcher(session)
+    assert fetcher.get(URL).text == "recipe"
+    assert fetcher.get(URL).text == "recipe"
+    assert fetcher.get(URL + ".missing").status_code == 404
+    assert fetcher.get(URL + ".missing").status_code == 404
+    assert len(session.requests) == 2
+    assert fetcher.stats() == {"requests": 2, "saved": 2, "not_modified": 0}
+
+
+def test_concurrent_requests_coalesce():
+    session = _Session(_Response(200, "recipe"), delay=0.2)
+    fetcher = ConditionalFetcher(session)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetcher.get(URL).text)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["recipe"] * 8
+    assert len(session.requests) == 1
+    assert fetcher.stats() == {"requests": 1, "saved": 7, "not_modified": 0}
+
+
+def test_failed_request_is_retried():
+    session = _Session(ConnectionError("reset"), _Response(200, "recipe"))
+    fetcher = ConditionalFetcher(session)
+    with pytest.raises(ConnectionError):
+        fetcher.get(URL)
+    assert fetcher.get(URL).text == "recipe"
+    assert len(session.requests) == 2
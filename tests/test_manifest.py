@@ -0,0 +1,148 @@
+import os
+import shutil
+
+import pytest
+import yaml
+
+from manifest import apply_changes, diff_entries, new_entry, parse_entries, read_commits, read_entries
+
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "manifest.yaml")
+
+# Values yaml reads as something other than the string they are, or that need quoting to stay what they are
+UNUSUAL_VALUES = [
+    '"abc"', 'W/"abc"', "'abc'", "it's", "0123", "1e5", "0x1f", "yes", "Off", "null", "~", "", "a: b", "a #b", "#abc",
+    "[a]", "{a}", "*a", "&a", "!a", "%a", "@a", "`a", "|", ">", "-", "- a", "?", "a#b", "a:b", "a:", " a", "a ", "a\tb",
+    "<<", "=", "W/\"a'b\"", "é",
+]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    path = tmp_path / "manifest.yaml"
+    shutil.copy(MANIFEST, path)
+    return path
+
+
+def _lines(path):
+    with open(path, "rb") as f:
+        return f.read().split(b"\n")
+
+
+def _yaml_entries(path):
+    with open(path) as f:
+        return yaml.safe_load(f)["feedstocks"]
+
+
+def test_parse_entries():
+    with open(MANIFEST) as f:
+        text = f.read()
+    assert parse_entries(text) == yaml.safe_load(text)["feedstocks"]
+    assert read_entries(MANIFEST)["delta-feedstock"] == {
+        "repo": "conda-forge/delta-feedstock",
+        "branch": "1.x",
+        "commit": "1234567890",
+        "ETag": '"8fbfbc9a92246ba1060641e37c187408328edf63b77556a3b323f35b533b9df2"',
+    }
+
+
+def test_update(manifest):
+    before = _lines(manifest)
+    apply_changes(str(manifest), updates={
+        "alpha-feedstock": {"commit": "0" * 40},
+        "omega-feedstock": {"ETag": 'W/"new"'},
+        "unknown-feedstock": {"commit": "1" * 40},
+    })
+    after = _lines(manifest)
+    # alpha gets a new commit line, omega an ETag line after its other fields, and no other line changes
+    commit = before.index(b"    commit:   71c290ea143959082026f965aee97d8176ab7e17")
+    assert after[commit] == b"    commit:   '" + b"0" * 40 + b"'"
+    omega = before.index(b"    commit:   d1d21f790071828797d17119fea84f2bbe6d0bfe")
+    assert after[omega + 1] == b'    ETag:     W/"new"'
+    assert after[:commit] + after[commit + 1:omega + 1] + after[omega + 2:] == before[:commit] + before[commit + 1:]
+
+    entries = read_entries(str(manifest))
+    assert entries == _yaml_entries(manifest)
+    assert entries["alpha-feedstock"]["commit"] == "0" * 40
+    assert entries["omega-feedstock"]["ETag"] == 'W/"new"'
+    assert "unknown-feedstock" not in entries
+
+
+def test_add(manifest):
+    before = _lines(manifest)
+    apply_changes(str(manifest), additions={
+        "beta-feedstock": new_entry("beta-feedstock", "a" * 40),
+        "zzz-feedstock": new_entry("zzz-feedstock", "b" * 40, branch="1.x"),
+    })
+    after = _lines(manifest)
+    beta = after.index(b"  beta-feedstock:")
+    assert after[beta:beta + 4] == [
+        b"  beta-feedstock:",
+        b"    repo:     conda-forge/beta-feedstock",
+        b"    branch:   main",
+        b"    commit:   " + b"a" * 40,
+    ]
+    zzz = after.index(b"  zzz-feedstock:")
+    # The new feedstocks go in sorted position, before the trailing blank line
+    assert after[zzz:] == [
+        b"  zzz-feedstock:",
+        b"    repo:     conda-forge/zzz-feedstock",
+        b"    branch:   1.x",
+        b"    commit:   " + b"b" * 40,
+        b"",
+        b"",
+    ]
+    assert after[:beta] + after[beta + 4:zzz] + after[zzz + 4:] == before
+    assert read_entries(str(manifest)) == _yaml_entries(manifest)
+
+
+def test_add_existing(manifest):
+    apply_changes(str(manifest), additions={"gamma-feedstock": new_entry("gamma-feedstock", "c" * 40)})
+    entries = read_entries(str(manifest))
+    assert entries["gamma-feedstock"] == {
+        "repo": "conda-forge/gamma-feedstock",
+        "branch": "main",
+        "commit": "c" * 40,
+        "ETag": 'W/"cd931ea6723ec7fa95d283c9b03b7223ae2c7ca5d61433e8d30eea0126b14ec6"',
+    }
+    assert len(entries) == 5
+
+
+def test_remove(manifest):
+    before = _lines(manifest)
+    apply_changes(str(manifest), removals=["alpha-feedstock", "omega-feedstock", "unknown-feedstock"])
+    alpha = before.index(b"  alpha-feedstock:")
+    omega = before.index(b"  omega-feedstock:")
+    assert _lines(manifest) == before[:alpha] + before[alpha + 5:omega] + before[omega + 4:]
+    assert sorted(read_entries(str(manifest))) == ["delta-feedstock", "gamma-feedstock", "zeta-feedstock"]
+
+
+def test_unchanged(manifest):
+    apply_changes(str(manifest))
+    with open(MANIFEST, "rb") as f:
+        assert manifest.read_bytes() == f.read()
+
+
+@pytest.mark.parametrize("value", UNUSUAL_VALUES)
+def test_round_trip(manifest, value):
+    apply_changes(
+        str(manifest),
+        updates={"alpha-feedstock": {"ETag": value}},
+        additions={"beta-feedstock": {**new_entry("beta-feedstock", "a" * 40), "ETag": value}},
+    )
+    entries = read_entries(str(manifest))
+    assert entries == _yaml_entries(manifest)
+    assert entries["alpha-feedstock"]["ETag"] == entries["beta-feedstock"]["ETag"] == value
+
+
+def test_commits_and_diff(manifest, tmp_path):
+    commits = tmp_path / "commits"
+    commits.write_text(f"{'d' * 40} alpha-feedstock\n{'e' * 40} new-feedstock\nno-commit-feedstock\n")
+    assert read_commits(str(commits)) == {"alpha-feedstock": "d" * 40, "new-feedstock": "e" * 40}
+
+    old = read_entries(str(manifest))
+    apply_changes(str(manifest), updates={"alpha-feedstock": {"commit": "d" * 40}}, removals=["zeta-feedstock"])
+    assert diff_entries(old, read_entries(str(manifest))) == {
+        "added": {},
+        "removed": {"zeta-feedstock": old["zeta-feedstock"]},
+        "changed": {"alpha-feedstock": {"commit": ["71c290ea143959082026f965aee97d8176ab7e17", "d" * 40]}},
+    }
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tarfile
+
+import pytest
+
+from outputs_index import OutputsIndex, build_index
+
+FEEDSTOCK_OUTPUTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "feedstock-outputs")
+
+
+@pytest.fixture
+def source(tmp_path):
+    # A copy, since the tests change it
+    path = tmp_path / "feedstock-outputs"
+    shutil.copytree(FEEDSTOCK_OUTPUTS, path)
+    return path
+
+
+def _output(source, package):
+    return source / "outputs" / package[0] / package[1] / package[2] / f"{package}.json"
+
+
+def _lookups(index_path):
+    index = OutputsIndex(str(index_path))
+    return len(index), {package: index.lookup(package) for package in ("numpy", "numpy-base", "libxml2", "zlib")}
+
+
+def test_lookup(source, tmp_path):
+    index_path = tmp_path / "outputs.sqlite"
+    # bad-package.json has no feedstocks and README.md isn't an output file
+    assert build_index(str(source), str(index_path)) == (4, 0)
+    assert _lookups(index_path) == (4, {
+        "numpy": ["numpy"],
+        "numpy-base": ["numpy"],
+        "libxml2": ["libxml2", "libxml2-devel"],
+        "zlib": ["zlib"],
+    })
+    index = OutputsIndex(str(index_path))
+    assert index.lookup("bad-package") == []
+    assert index.lookup("unknown") == []
+
+
+def test_tarball(source, tmp_path):
+    tarball = tmp_path / "feedstock-outputs.tar.gz"
+    with tarfile.open(tarball, "w:gz") as tar:
+        tar.add(source, arcname="feedstock-outputs-main")
+    index_path = tmp_path / "outputs.sqlite"
+    assert build_index(str(tarball), str(index_path)) == (4, 0)
+    assert build_index(str(tarball), str(index_path)) == (0, 0)
+    assert _lookups(index_path) == _lookups(_built(source, tmp_path / "directory.sqlite"))
+
+
+def _built(source, index_path):
+    build_index(str(source), str(index_path))
+    return index_path
+
+
+def test_refresh(source, tmp_path):
+    index_path = _built(source, tmp_path / "outputs.sqlite")
+    # Nothing changed, nothing is read again
+    assert build_index(str(source), str(index_path)) == (0, 0)
+
+    # Touching a file refreshes only that entry
+    zlib = _output(source, "zlib")
+    stat = zlib.stat()
+    os.utime(zlib, (stat.st_atime, stat.st_mtime + 10))
+    assert build_index(str(source), str(index_path)) == (1, 0)
+
+    # As does a change of size with the same mtime
+    numpy_base = _output(source, "numpy-base")
+    stat = numpy_base.stat()
+    numpy_base.write_text('{"feedstocks": ["numpy", "numpy-base"]}\n')
+    os.utime(numpy_base, (stat.st_atime, stat.st_mtime))
+    assert build_index(str(source), str(index_path)) == (1, 0)
+    assert OutputsIndex(str(index_path)).lookup("numpy-base") == ["numpy", "numpy-base"]
+
+    # A removed file drops its entry and leaves the others alone
+    _output(source, "libxml2").unlink()
+    assert build_index(str(source), str(index_path)) == (0, 1)
+    assert _lookups(index_path) == (3, {
+        "numpy": ["numpy"],
+        "numpy-base": ["numpy", "numpy-base"],
+        "libxml2": [],
+        "zlib": ["zlib"],
+    })
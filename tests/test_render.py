@@ -0,0 +1,87 @@
+import os
+
+import jinja2
+import pytest
+
+from render import (
+    _SizeBoundedBytecodeCache, platform_selectors, recipe_deps, render_deps_multi, render_multi, verify_fast_render,
+)
+
+RECIPES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "recipes")
+PLATFORMS = ("linux-64", "osx-64", "osx-arm64", "win-64")
+
+# Whether the fast path reads the recipe itself or leaves it to the full render
+EXPECTED = {
+    "selectors.yaml": "fast",
+    "multi-output.yaml": "fast",
+    "quoted.yaml": "fast",
+    "flow-style.yaml": "fallback",
+    "loop.yaml": "fallback",
+}
+
+
+def _recipe(name) -> str:
+    with open(os.path.join(RECIPES, name)) as f:
+        return f.read()
+
+
+def test_every_recipe_listed():
+    assert sorted(os.listdir(RECIPES)) == sorted(EXPECTED)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_deps_match_full_render(name):
+    meta_yaml = _recipe(name)
+    selector_dicts = [platform_selectors(platform) for platform in PLATFORMS]
+    full = recipe_deps(dict(zip(PLATFORMS, render_multi(meta_yaml, selector_dicts))))
+    assert render_deps_multi(meta_yaml, selector_dicts) == [full[platform] for platform in PLATFORMS]
+    statuses = [status for status, _, _ in verify_fast_render(meta_yaml, selector_dicts)]
+    assert statuses == [EXPECTED[name]] * len(PLATFORMS)
+
+
+def test_selectors_and_outputs():
+    meta_yaml = _recipe("multi-output.yaml")
+    linux, win = render_deps_multi(meta_yaml, [platform_selectors("linux-64"), platform_selectors("win-64")])
+    assert linux.version == "2.0.1"
+    assert linux.output_names() == ("libbar", "bar-python", "bar-tools")
+    assert win.output_names() == ("libbar", "bar-python")
+    assert (linux.outputs[0].run, win.outputs[0].run) == (("libboost",), ())
+    assert win.outputs[1].run == ("python", "libbar", "pywin32")
+
+
+def test_quoted_values():
+    deps, = render_deps_multi(_recipe("quoted.yaml"), [platform_selectors("linux-64")])
+    # "0.10" stays a string rather than becoming the number 0.1
+    assert (deps.recipe.name, deps.version) == ("quoted", "0.10")
+    assert deps.recipe.host == ("python", "pip", "setuptools-scm >=6.2")
+    assert deps.recipe.run == ("python >=3.8", "it's-a-package", "packaging")
+
+
+def _dump(cache, key, source):
+    bucket = jinja2.bccache.Bucket(jinja2.Environment(), key, "checksum")
+    bucket.code = compile(source, key, "exec")
+    cache.dump_bytecode(bucket)
+
+
+def _size_on_disk(directory):
+    return sum(path.stat().st_size for path in directory.glob("*.jinja"))
+
+
+def test_bytecode_cache_size(tmp_path):
+    cache = _SizeBoundedBytecodeCache(str(tmp_path), max_bytes=1 << 20)
+    # Writing the same template again replaces its file rather than adding to the size
+    for _ in range(5):
+        _dump(cache, "a", "x = 1")
+    _dump(cache, "b", "y = [" + "1, " * 100 + "]")
+    _dump(cache, "a", "x = 'a longer template than before'")
+    assert cache._size == _size_on_disk(tmp_path)
+    assert cache.evictions == 0
+    assert _SizeBoundedBytecodeCache(str(tmp_path), max_bytes=1 << 20)._size == cache._size
+
+
+def test_bytecode_cache_eviction(tmp_path):
+    cache = _SizeBoundedBytecodeCache(str(tmp_path), max_bytes=4096)
+    for i in range(100):
+        _dump(cache, f"t{i}", f"x = {i}; y = '{'y' * 64}'")
+    assert cache.evictions > 0
+    assert cache._size == _size_on_disk(tmp_path) <= 4096
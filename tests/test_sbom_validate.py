@@ -0,0 +1,73 @@
+import functools
+import hashlib
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sbom_validate import SbomValidator, index_paths
+
+SBOMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sboms")
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def sbom_server():
+    # Serves the fixture SBOMs on an ephemeral port, with the Last-Modified and 304s of http.server
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=SBOMS))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def _digest(path):
+    with open(os.path.join(SBOMS, path), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _index():
+    return {"paths": {
+        # Its name comes after nested ones that aren't the top level name
+        "a-1.0-0.conda.spdx.json": {"sha256": _digest("a-1.0-0.conda.spdx.json")},
+        # Named after the package file rather than its index path
+        "b-1.0-0.tar.bz2.spdx.json": {},
+        "c-1.0-0.conda.spdx.json": {"sha256": _digest("c-1.0-0.conda.spdx.json")},
+        "missing-1.0-0.conda.spdx.json": {},
+    }}
+
+
+def test_validate(sbom_server):
+    result = SbomValidator(sbom_server, workers=4).validate(index_paths(_index()))
+    assert result["mismatches"] == {
+        "b-1.0-0.tar.bz2.spdx.json": "b-1.0-0.tar.bz2",
+        "c-1.0-0.conda.spdx.json": "something else",
+    }
+    assert list(result["errors"]) == ["missing-1.0-0.conda.spdx.json"]
+    assert result["errors"]["missing-1.0-0.conda.spdx.json"].startswith("[404]")
+    stats = result["stats"]
+    assert stats["paths"] == 4
+    assert (stats["fetched"], stats["not_modified"], stats["unchanged"], stats["error"]) == (3, 0, 0, 1)
+
+
+def test_second_run(sbom_server):
+    paths = index_paths(_index())
+    first = SbomValidator(sbom_server, workers=4)
+    first.validate(paths)
+    second = SbomValidator(sbom_server, workers=4, state=first.state)
+    result = second.validate(paths)
+    # SBOMs with an unchanged hash in the index aren't requested, the others are revalidated with If-Modified-Since
+    stats = result["stats"]
+    assert (stats["fetched"], stats["not_modified"], stats["unchanged"], stats["error"]) == (0, 1, 2, 1)
+    assert stats["bytes"] == 0
+    assert result["mismatches"] == {
+        "b-1.0-0.tar.bz2.spdx.json": "b-1.0-0.tar.bz2",
+        "c-1.0-0.conda.spdx.json": "something else",
+    }
+    assert list(result["errors"]) == ["missing-1.0-0.conda.spdx.json"]
@@ -0,0 +1,178 @@
+import copy
+import json
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sort import EquivalenceClass, topological_sort
+
+DEPENDENCY_GRAPH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dependency-graph.json")
+
+
+# The topological sort as it was before the SCC condensation, kept as the reference for the current one. The only
+# changes are that it works on a copy of the edge map, which it used to mutate, and that the node a cycle is collected
+# from is no longer an arbitrary set.pop() but taken from the ready cycle with the smallest member, like the current
+# implementation does. When there is no ready cycle, because everything left depends on a cycle nothing outside it leads
+# into, it stops; the original collected whatever the popped node depended on into one bogus cycle there, or dropped
+# the rest silently if nothing was blocked.
+
+def _copy_edge_map(edge_map: Dict[str, Set[str]]) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+    depends_on = {}
+    required_by = {}
+    for src, destinations in edge_map.items():
+        depends_on[src] = destinations
+        required_by.setdefault(src, set())
+        for dest in destinations:
+            depends_on.setdefault(dest, set())
+            required_by.setdefault(dest, set()).add(src)
+    return depends_on, required_by
+
+
+def _find_unreferenced(nodes: Set[str], depends_on: Dict[str, Set[str]]) -> Tuple[Set[str], Set[str]]:
+    unreferenced = {node for node in nodes if not depends_on.get(node)}
+    return unreferenced, nodes.difference(unreferenced)
+
+
+def _collect_dependencies(node: str, depends_on: Dict[str, Set[str]]) -> Set[str]:
+    cycle_nodes = {node}
+    to_add = depends_on[node]
+    while not to_add.issubset(cycle_nodes):
+        cycle_nodes.update(to_add)
+        to_add = {dependency for n in to_add for dependency in depends_on[n]}
+    return cycle_nodes
+
+
+def _pick_cycle(blocked: Set[str], depends_on: Dict[str, Set[str]]) -> Optional[str]:
+    # A blocked node is in a ready cycle if it can reach back to itself from everything it still depends on
+    collected = {node: _collect_dependencies(node, depends_on) for node in blocked}
+    ready = [
+        node for node, cycle_nodes in collected.items()
+        if all(node in _collect_dependencies(other, depends_on) for other in cycle_nodes)
+    ]
+    if not ready:
+        return None
+    node = min(ready, key=lambda node: min(collected[node]))
+    blocked.discard(node)
+    return node
+
+
+def reference_topological_sort(edge_map: Dict[str, Set[str]]) -> Iterable[EquivalenceClass]:
+    depends_on, required_by = _copy_edge_map(copy.deepcopy(edge_map))
+
+    candidates = {node for node, dependencies in depends_on.items() if not dependencies}
+    unblocked = candidates
+    blocked = set()
+
+    while unblocked or blocked:
+        if unblocked:
+            new_candidates = {child for node in unblocked for child in required_by[node]}
+            candidates = blocked.union(new_candidates)
+            for node in new_candidates:
+                depends_on[node].difference_update(unblocked)
+            yield EquivalenceClass(members=unblocked, cycle_edges={})
+        else:
+            node = _pick_cycle(blocked, depends_on)
+            if node is None:
+                return
+            cycle_nodes = _collect_dependencies(node, depends_on)
+            new_candidates = {child for node in cycle_nodes for child in required_by[node] if child not in cycle_nodes}
+            candidates = blocked.difference(cycle_nodes).union(new_candidates)
+            for node in new_candidates:
+                depends_on[node].difference_update(cycle_nodes)
+            cycle_edges = {node: set(depends_on[node]) for node in cycle_nodes}
+            yield EquivalenceClass(members=cycle_nodes, cycle_edges=cycle_edges)
+
+        unblocked, blocked = _find_unreferenced(candidates, depends_on)
+
+
+def _nodes(edge_map: Dict[str, Set[str]]) -> Set[str]:
+    return set(edge_map).union(*edge_map.values())
+
+
+def _random_graph(rng: random.Random, size: int, density: float, back_edges: float) -> Dict[str, Set[str]]:
+    # Mostly edges to lower numbered nodes, which keeps the graph layered, plus a few back edges making cycles
+    nodes = [f"pkg{i:03}" for i in range(size)]
+    edge_map = {}
+    for i, node in enumerate(nodes):
+        dependencies = {nodes[j] for j in range(i) if rng.random() < density}
+        dependencies.update(nodes[j] for j in range(i, size) if rng.random() < back_edges)
+        edge_map[node] = dependencies
+    # Dependencies that have no recipe of their own only show up as edge targets
+    for node in rng.sample(nodes, size // 10):
+        if not any(node in dependencies for dependencies in edge_map.values()):
+            continue
+        del edge_map[node]
+    return edge_map
+
+
+def _assert_same_order(edge_map: Dict[str, Set[str]]):
+    expected = list(reference_topological_sort(edge_map))
+    reference_nodes = {node for group in expected for node in group.members}
+    if reference_nodes != _nodes(edge_map):
+        # The reference drops the cycles nothing outside them leads into, and everything depending on them (see
+        # test_cycle_without_entry), so compare on what's left; none of it depends on a dropped node
+        edge_map = {node: edge_map.get(node, set()) for node in reference_nodes}
+    before = copy.deepcopy(edge_map)
+    assert list(topological_sort(edge_map)) == expected
+    assert edge_map == before
+
+
+def test_random_graphs():
+    rng = random.Random(20261018)
+    for _ in range(2000):
+        _assert_same_order(_random_graph(rng, rng.randint(1, 40), rng.uniform(0, 0.3), rng.uniform(0, 0.05)))
+
+
+def test_every_node_once():
+    rng = random.Random(1)
+    for _ in range(500):
+        edge_map = _random_graph(rng, rng.randint(1, 40), rng.uniform(0, 0.3), rng.uniform(0, 0.1))
+        groups = list(topological_sort(edge_map))
+        members: List[str] = [node for group in groups for node in group.members]
+        assert len(members) == len(set(members))
+        assert set(members) == _nodes(edge_map)
+        # Everything a node depends on outside its own cycle comes in an earlier group
+        position = {node: i for i, group in enumerate(groups) for node in group.members}
+        for node, dependencies in edge_map.items():
+            for dependency in dependencies:
+                assert position[dependency] < position[node] or (
+                    position[dependency] == position[node] and groups[position[node]].cycle_edges
+                )
+
+
+def test_cycle_without_entry():
+    # b and c only depend on each other, so neither is ever free of dependencies, and d depends on that cycle
+    edge_map = {"a": set(), "b": {"c"}, "c": {"b"}, "d": {"a", "c"}}
+    assert list(reference_topological_sort(edge_map)) == [EquivalenceClass(members={"a"}, cycle_edges={})]
+    assert list(topological_sort(edge_map)) == [
+        EquivalenceClass(members={"a"}, cycle_edges={}),
+        EquivalenceClass(members={"b", "c"}, cycle_edges={"b": {"c"}, "c": {"b"}}),
+        EquivalenceClass(members={"d"}, cycle_edges={}),
+    ]
+
+
+def test_self_dependency():
+    edge_map = {"a": {"a"}, "b": {"a"}}
+    assert list(topological_sort(edge_map)) == [
+        EquivalenceClass(members={"a"}, cycle_edges={"a": {"a"}}),
+        EquivalenceClass(members={"b"}, cycle_edges={}),
+    ]
+
+
+def test_deep_chain():
+    # Deeper than the recursion limit
+    edge_map = {f"pkg{i}": {f"pkg{i + 1}"} for i in range(5000)}
+    edge_map["pkg5000"] = {"pkg0"}
+    groups = list(topological_sort(edge_map))
+    assert len(groups) == 1 and len(groups[0].members) == 5001
+
+
+def test_crawl_output():
+    # A pruned graph in the format crawl_deptree.py --graph writes, with the cycles of a real crawl: pip, setuptools
+    # and wheel, cmake and its libraries, perl building itself and two test requirements of each other
+    with open(DEPENDENCY_GRAPH) as f:
+        data = json.load(f)
+    for dependency_map in data["edges"].values():
+        edge_map = {feedstock: set(dependencies) for feedstock, dependencies in dependency_map.items()}
+        assert sum(1 for group in topological_sort(edge_map) if group.cycle_edges) >= 3
+        _assert_same_order(edge_map)
@@ -0,0 +1,74 @@
+import pytest
+
+from versions import compile_spec, sorted_keys, version_key
+
+VERSIONS = [
+    "0.9", "1.0", "1rc1", "1.1", "1.2.dev0", "1.2a", "1.2rc1", "1.2", "1.2.0", "1.2.0rc1", "1.2.3rc1", "1.2.3",
+    "1.2.3.4", "1.2.post1", "1.3", "1.4.1", "1.20", "2", "2.0", "2.1", "2.1.5", "2.2", "3.0", "3.10", "1!1.2",
+]
+
+_ONE_TWO = {
+    "1.2.dev0", "1.2a", "1.2rc1", "1.2", "1.2.0", "1.2.0rc1", "1.2.3rc1", "1.2.3", "1.2.3.4", "1.2.post1",
+}
+
+# The versions of VERSIONS conda's VersionSpec(spec).match accepts
+SPECS = [
+    ("1.2.*", _ONE_TWO),
+    ("=1.2", _ONE_TWO),
+    ("!=1.2.*", set(VERSIONS) - _ONE_TWO),
+    ("==1.2", {"1.2", "1.2.0"}),
+    ("1.2", {"1.2", "1.2.0"}),
+    ("!=1.2", set(VERSIONS) - {"1.2", "1.2.0"}),
+    # Missing components are 0, so 1.2.dev0 is 1.2.0.dev0
+    ("=1.2.0", {"1.2.dev0", "1.2", "1.2.0", "1.2.0rc1", "1.2.post1"}),
+    ("1.2.0.*", {"1.2.dev0", "1.2", "1.2.0", "1.2.0rc1", "1.2.post1"}),
+    ("1.*", {"1rc1", "1.0", "1.1", "1.3", "1.4.1", "1.20"} | _ONE_TWO),
+    ("*", set(VERSIONS)),
+    (">=1.2,<2", {"1.2", "1.2.0", "1.2.3rc1", "1.2.3", "1.2.3.4", "1.2.post1", "1.3", "1.4.1", "1.20"}),
+    (">=1.2,<2|3.*", {
+        "1.2", "1.2.0", "1.2.3rc1", "1.2.3", "1.2.3.4", "1.2.post1", "1.3", "1.4.1", "1.20", "3.0", "3.10",
+    }),
+    ("<1.2|>=2,!=2.1", {
+        "0.9", "1.0", "1rc1", "1.1", "1.2.dev0", "1.2a", "1.2rc1", "1.2.0rc1", "2", "2.0", "2.1.5", "2.2", "3.0",
+        "3.10", "1!1.2",
+    }),
+    (">=1.0,!=1.2.*,<2", {"1.0", "1.1", "1.3", "1.4.1", "1.20"}),
+    ("2.*,!=2.1.*|1.0", {"1.0", "2", "2.0", "2.2"}),
+    (">=1.2.*", set(VERSIONS) - {"0.9", "1.0", "1rc1", "1.1", "1.2.dev0", "1.2a", "1.2rc1", "1.2.0rc1"}),
+    ("~=1.2", {"1.2", "1.2.0", "1.2.3rc1", "1.2.3", "1.2.3.4", "1.2.post1", "1.3", "1.4.1", "1.20"}),
+    ("~=1.2.3", {"1.2.3", "1.2.3.4"}),
+]
+
+
+@pytest.mark.parametrize("spec, expected", SPECS)
+def test_contains(spec, expected):
+    assert {version for version in VERSIONS if compile_spec(spec).contains(version)} == expected
+
+
+@pytest.mark.parametrize("spec, expected", SPECS)
+def test_any_of(spec, expected):
+    compiled = compile_spec(spec)
+    for version in VERSIONS:
+        assert compiled.any_of(sorted_keys([version])) == (version in expected)
+    assert compiled.any_of(sorted_keys(VERSIONS)) == bool(expected)
+    assert not compiled.any_of(sorted_keys([version for version in VERSIONS if version not in expected]))
+
+
+# In conda's VersionOrder order; the components are compared in turn, so 1.0a1 comes before 1.0.dev0
+ORDERED = [
+    "0.5.0", "1.0dev", "1.0a1", "1.0b2", "1.0rc", "1.0rc1", "1.0.dev0", "1.0.0a1", "1.0", "1.0.0.0.1", "1.0.post1",
+    "1.0.1", "1.1", "1.9", "1.10", "2", "2021.10.1", "1!0.5",
+]
+
+
+def test_order():
+    assert sorted(ORDERED, key=version_key) == ORDERED
+    assert len({version_key(version) for version in ORDERED}) == len(ORDERED)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("1.0", "1.0.0"), ("1.0_1", "1.0.1"), ("1.0-1", "1.0.1"), ("1.0RC1", "1.0rc1"), ("0!1.0", "1.0"), ("1.0a", "1.0a0"),
+    ("1.0post", "1.0post0"), ("1.0.dev", "1.0.0dev"),
+])
+def test_same_version(a, b):
+    assert version_key(a) == version_key(b)
@@ -0,0 +1,146 @@
+# In-memory caches with a budget in bytes.
+# Each cached function gets a namespace of its own, so a big cache (rendered recipes) can't push a small one
+# (feedstock names) out. An entry counts with the deep size of its value; once a namespace is over budget the least
+# recently used entries are evicted. Every namespace counts its hits, misses and evictions so we can tell whether it's
+# sized right.
+import argparse
+import sys
+import threading
+import types
+from typing import Dict
+
+from cachetools import LRUCache
+
+MB = 1024 * 1024
+# Values may refer to these, but they aren't part of the value
+_SHARED = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+
+def deep_sizeof(value) -> int:
+    """Size of a value and everything it holds, counting objects shared within it once"""
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, _SHARED):
+            continue
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.append(vars(obj))
+        elif hasattr(obj, "__slots__"):
+            stack.extend(getattr(obj, slot) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+class BudgetedCache(LRUCache):
+    """An LRU cache holding at most max_bytes worth of values"""
+
+    def __init__(self, name: str, max_bytes: int):
+        # The budget is enforced here rather than by the base class, so it can be changed later
+        super().__init__(maxsize=float("inf"), getsizeof=deep_sizeof)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.hits += 1
+        return value
+
+    def __missing__(self, key):
+        self.misses += 1
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        size = self.getsizeof(value)
+        if size > self.max_bytes:
+            # Like any cachetools cache; the cached decorators just don't store the value
+            raise ValueError("value too large")
+        super().__setitem__(key, value)
+        self._evict()
+
+    def _evict(self):
+        while self.currsize > self.max_bytes:
+            # popitem reads the entry through __getitem__, which isn't a hit
+            hits = self.hits
+            self.popitem()
+            self.hits = hits
+            self.evictions += 1
+
+    def resize(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "bytes": int(self.currsize),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CacheRegistry:
+    """The namespaces of a program, or of an object with caches of its own"""
+
+    def __init__(self):
+        self._caches: Dict[str, BudgetedCache] = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, name: str, max_bytes: int) -> BudgetedCache:
+        """The cache of a namespace, created with a budget of max_bytes the first time"""
+        with self._lock:
+            if name not in self._caches:
+                self._caches[name] = BudgetedCache(name, max_bytes)
+            return self._caches[name]
+
+    def __getitem__(self, name: str) -> BudgetedCache:
+        return self._caches[name]
+
+    def configure(self, sizes: Dict[str, int]):
+        """Set the budget in bytes of the given namespaces"""
+        for name, max_bytes in sizes.items():
+            if name not in self._caches:
+                raise ValueError(f"Unknown cache {name}, expected one of {', '.join(sorted(self._caches))}")
+            self._caches[name].resize(max_bytes)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: cache.stats() for name, cache in sorted(self._caches.items())}
+
+    def stats_lines(self):
+        for name, stats in self.stats().items():
+            yield f"Cache {name}: " + ", ".join(f"{key}={value}" for key, value in stats.items())
+
+
+def parse_sizes(text: str) -> Dict[str, int]:
+    """Budgets given as name=MB,name=MB on the command line, in bytes"""
+    sizes = {}
+    for item in text.split(","):
+        if not item:
+            continue
+        name, _, megabytes = item.partition("=")
+        try:
+            sizes[name.strip()] = int(float(megabytes) * MB)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Cache sizes must look like name=MB, got {item}")
+    return sizes
+
+
+registry = CacheRegistry()
+
+
+def namespace(name: str, max_bytes: int) -> BudgetedCache:
+    return registry.namespace(name, max_bytes)
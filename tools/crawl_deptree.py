@@ -1,20 +1,36 @@
 #!/usr/bin/env python
 # This was derived from https://github.com/anaconda-distribution/distro-incubator/blob/main/akabanovs/pkg_check_availability/pkg_check_availability.py
 import argparse
-import collections
+import json
 import re
+import threading
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Set, Dict
 
 import requests
-import yaml
-from cachetools import Cache, LRUCache, cached
+from requests.adapters import HTTPAdapter
+from cachetools import cached
+from cachetools.keys import hashkey
 
+import caches
+import manifest
 import sort
-from render import render
-
-metadata_cache: Cache = LRUCache(maxsize=1000)
-feedstock_cache: Cache = LRUCache(maxsize=1000)
+from dep_graph import DependencyGraph
+from fetch import ConditionalFetcher
+from outputs_index import OutputsIndex
+from policy import DependencyPolicy
+from recipe_store import RecipeStore, pinnings_hash
+from render import (
+    RENDER_SOURCE, configure_template_cache, platform_selectors, recipe_deps, render_deps_multi, render_many,
+    render_multi, template_cache_stats
+)
+
+metadata_cache = caches.namespace("metadata", 1024 * caches.MB)
+feedstock_cache = caches.namespace("feedstock", 16 * caches.MB)
+config_cache = caches.namespace("config", 64 * caches.MB)
+# The crawl runs lookups from a thread pool, so guard the shared caches
+cache_lock = threading.RLock()
 
 
 warnings.simplefilter("ignore")
@@ -24,64 +40,171 @@ excluded_packages = [
 ]
 
 
-def get_requirements(data, name, section, attribute):
-    reqs = data.get(section, {}).get(attribute, [])
-    if section == "requirements":
-        for out in data.get("outputs", {}):
-            if out.get("name","") == name:
-                reqs = reqs + out.get(section, {}).get(attribute, [])
-    return reqs
+def get_default_location(pkg_name):
+    return [f"{pkg_name}-feedstock"]
 
 
-def read_requirements(data, name, section, attribute):
-    try:
-        req = get_requirements(data, name, section, attribute)
-        if not isinstance(req, list):
-            req = []
-    except:
-        req = []
-    return req
+def get_location_by_lookup(pkg_name):
+    feedstock_name = lookup_feedstock_name(pkg_name)
+    if feedstock_name:
+        yield f"{feedstock_name}-feedstock"
 
 
-def get_default_location(pkg_name):
-    return [f"{github_base_url}/conda-forge/{pkg_name}-feedstock/main/recipe/meta.yaml"]
+location_probes = [get_default_location, get_location_by_lookup]
 
 
-def get_location_by_lookup(pkg_name):
-    for feedstock_name in lookup_feedstock_name(pkg_name):
-        yield f"{github_base_url}/conda-forge/{feedstock_name}-feedstock/main/recipe/meta.yaml"
+def recipe_url(feedstock):
+    # Feedstocks in manifest.yaml are read at their commit there, which is also what their render is stored under
+    commit = get_manifest_entries().get(feedstock, {}).get("commit")
+    return f"{github_base_url}/conda-forge/{feedstock}/{commit or 'main'}/recipe/meta.yaml"
 
 
-location_probes = [get_default_location, get_location_by_lookup]
+def load_stored(feedstock, revision):
+    """The stored renders for every platform, or None unless all of them are in the recipe store"""
+    metadata = {
+        arch: recipe_store.get(feedstock, revision, arch, get_pinnings_hash(arch))
+        for arch in selector_dicts
+    }
+    return metadata if all(rendered is not None for rendered in metadata.values()) else None
 
 
-@cached(metadata_cache)
-def get_metadata(pkg_name: str):
+def locate_recipe(pkg_name: str):
+    """
+    Find the recipe of the feedstock providing pkg_name.
+    Returns (feedstock, revision, metadata, text) where metadata is only set if the renders were already stored
+    and text is the raw recipe otherwise, or None if there is no recipe.
+    """
     if not include_dependency(pkg_name):
         return None
 
     for location_provider in location_probes:
-        for url in location_provider(pkg_name):
-            response = session.get(url, allow_redirects=False)
+        for feedstock in location_provider(pkg_name):
+            entry = get_manifest_entries().get(feedstock, {})
+            # Feedstocks in the manifest have a known commit, so their render can be reused across runs
+            commit = entry.get("commit") if recipe_store is not None else None
+            if commit:
+                metadata = load_stored(feedstock, commit)
+                if metadata is not None:
+                    return feedstock, commit, metadata, None
+            response = fetcher.get(recipe_url(feedstock))
             if response.status_code == 200:
-                data = response.text
-                return render(data, {'target_platform': 'linux-64'})
+                # Otherwise the ETag identifies the recipe, which lets us reuse the render after a 304
+                revision = commit or (f"etag:{response.etag}" if response.etag else None)
+                if recipe_store is not None and revision and not commit:
+                    metadata = load_stored(feedstock, revision)
+                    if metadata is not None:
+                        return feedstock, revision, metadata, None
+                return feedstock, revision, None, response.text
 
     return None
 
 
-def extract_deps(data, name):
-    deps_collection = read_requirements(data, name, "requirements", "build") \
-                      + read_requirements(data, name, "requirements", "run") \
-                      + read_requirements(data, name, "requirements", "host")
-    dependencies = {dep.split()[0] for dep in deps_collection if isinstance(dep, str)}
+def store_rendered(feedstock, revision, rendered_platforms):
+    metadata = dict(zip(selector_dicts, rendered_platforms))
+    if recipe_store is not None and revision:
+        for arch, rendered in metadata.items():
+            if isinstance(rendered, dict):
+                recipe_store.put(feedstock, revision, arch, get_pinnings_hash(arch), rendered)
+    if all(rendered is None for rendered in metadata.values()):
+        return None
+    return metadata
+
+
+def render_recipe(pkg_name: str):
+    """Full rendered recipe of the feedstock providing pkg_name, for every platform we crawl. Not cached"""
+    recipe = locate_recipe(pkg_name)
+    if recipe is None:
+        return None
+    feedstock, revision, metadata, text = recipe
+    if metadata is None:
+        metadata = store_rendered(feedstock, revision, render_multi(text, list(selector_dicts.values())))
+    return metadata
+
+
+def platform_deps(deps_platforms):
+    """The RecipeDeps read with the fast path by platform, or None if the recipe didn't render on any"""
+    metadata = dict(zip(selector_dicts, deps_platforms))
+    if all(deps is None for deps in metadata.values()):
+        return None
+    return metadata
+
+
+@cached(metadata_cache, lock=cache_lock)
+def get_metadata(pkg_name: str):
+    """Requirements of the recipe (a RecipeDeps) of the feedstock providing pkg_name, for every platform we crawl"""
+    if not fast_render:
+        metadata = render_recipe(pkg_name)
+        return recipe_deps(metadata) if metadata else None
+    recipe = locate_recipe(pkg_name)
+    if recipe is None:
+        return None
+    _, _, metadata, text = recipe
+    if metadata is not None:
+        return recipe_deps(metadata)
+    return platform_deps(render_deps_multi(text, list(selector_dicts.values())))
+
+
+def try_locate_recipe(pkg_name: str):
+    """locate_recipe, or False if it failed"""
+    try:
+        return locate_recipe(pkg_name)
+    except Exception:
+        return False
+
+
+def prerender(packages, executor, render_executor, chunksize):
+    """
+    Fetch the recipes of the packages on the (thread) executor, then render them as one batch on the render
+    executor, usually a process pool, and seed the get_metadata cache with the results.
+    """
+    with cache_lock:
+        pending = [pkg_name for pkg_name in packages if hashkey(pkg_name) not in metadata_cache]
+    located = [(pkg_name, recipe) for pkg_name, recipe in zip(pending, executor.map(try_locate_recipe, pending))
+               if recipe is not False]
+    to_render = [(pkg_name, recipe) for pkg_name, recipe in located if recipe is not None and recipe[2] is None]
+    rendered = render_many(
+        [(text, list(selector_dicts.values())) for _, (_, _, _, text) in to_render],
+        render_executor,
+        chunksize,
+        deps_only=fast_render,
+    )
+    results = {pkg_name: recipe and recipe[2] and recipe_deps(recipe[2]) for pkg_name, recipe in located}
+    for (pkg_name, (feedstock, revision, _, _)), rendered_platforms in zip(to_render, rendered):
+        if rendered_platforms is None:
+            # Left to get_metadata, which fails on it the way a crawl without prerendering does
+            del results[pkg_name]
+            continue
+        if fast_render:
+            results[pkg_name] = platform_deps(rendered_platforms)
+            continue
+        metadata = store_rendered(feedstock, revision, rendered_platforms)
+        results[pkg_name] = recipe_deps(metadata) if metadata else None
+    with cache_lock:
+        for pkg_name, metadata in results.items():
+            try:
+                metadata_cache[hashkey(pkg_name)] = metadata
+            except ValueError:
+                # Too large for the cache, get_metadata will render it again
+                pass
+
+
+def extract_deps(recipe, name):
+    if recipe is None:
+        return set()
+    dependencies = {dep.split()[0] for dep in recipe.requirements(name)}
     return set(filter(include_dependency, dependencies))
 
 
-@cached(feedstock_cache)
+@cached(feedstock_cache, lock=cache_lock)
 def lookup_feedstock_name(dep):
     if len(dep) < 3:
         return ""
+    if outputs_index is not None:
+        feedstocks = outputs_index.lookup(dep)
+        if not feedstocks:
+            print(f"Could not find feedstock for {dep} in the outputs index")
+            return ""
+        return feedstocks[0]
     url = f"{github_base_url}/conda-forge/feedstock-outputs/main/outputs/{dep[0]}/{dep[1]}/{dep[2]}/{dep}.json"
     response = session.get(url, allow_redirects=False)
     if response.status_code != 200:
@@ -116,11 +239,86 @@ def create_parser() -> argparse.ArgumentParser:
                         action=argparse.BooleanOptionalAction,
                         default=False,
                         help="Flag to only sort the given list of feedstocks")
+    parser.add_argument('-w',
+                        '--workers',
+                        type=int,
+                        default=8,
+                        help="Number of feedstocks to resolve concurrently")
+    parser.add_argument('-a',
+                        '--archs',
+                        default="",
+                        help="Space separated list of platforms to crawl, e.g. 'linux-64 osx-arm64'. "
+                             "Recipes are rendered for all of them in one pass and a build order is printed per platform")
+    parser.add_argument('--render_workers',
+                        type=int,
+                        default=0,
+                        help="Number of processes to render recipes in. By default recipes are rendered in-process")
+    parser.add_argument('--render_chunksize',
+                        type=int,
+                        default=8,
+                        help="Number of recipes sent to a render process at once")
+    parser.add_argument('--recipe_store',
+                        default=None,
+                        help="Directory of a persistent store of rendered recipes. "
+                             "Feedstocks whose commit in manifest.yaml is unchanged are not fetched again")
+    parser.add_argument('--outputs_index',
+                        default=None,
+                        help="Local feedstock-outputs index built by outputs_index.py. "
+                             "Used instead of querying conda-forge/feedstock-outputs over the network")
+    parser.add_argument('--http_cache',
+                        default=None,
+                        help="Directory to keep fetched recipes in. "
+                             "Cached recipes are revalidated with If-None-Match/If-Modified-Since instead of downloaded again")
+    parser.add_argument('--fast_render',
+                        action="store_true",
+                        help="Read the requirements of recipes without a full render, by evaluating only their "
+                             "{%% set %%} variables and selectors. Recipes it can't handle are rendered in full. "
+                             "Nothing is added to --recipe_store")
+    parser.add_argument('--template_cache',
+                        default=None,
+                        help="Directory to keep compiled recipe templates in, so unchanged recipes are not compiled again")
+    parser.add_argument('--template_cache_size',
+                        type=int,
+                        default=256,
+                        help="Size limit of the --template_cache directory in MB")
+    parser.add_argument('--cache_sizes',
+                        type=caches.parse_sizes,
+                        default={},
+                        help="Memory budget of the in-memory caches in MB, as name=MB,name=MB. The caches are "
+                             "metadata (requirements of rendered recipes, 1024 by default), feedstock (16) and config (64)")
+    parser.add_argument('--cache_stats',
+                        action="store_true",
+                        help="Print the hits, misses and evictions of every in-memory cache, and the number of recipe "
+                             "requests sent and saved, before the build order")
+    parser.add_argument('--graph',
+                        default=None,
+                        help="Dependency graph file to crawl incrementally. Only feedstocks that are new, listed in "
+                             "--changed, or whose commit in manifest.yaml (or recipe, if they aren't in the manifest) "
+                             "changed are crawled again, and the updated graph is written back. With --sort_only the "
+                             "graph is only read")
+    parser.add_argument('--changed',
+                        default="",
+                        help="Comma separated list of feedstocks to crawl again when using --graph")
+    parser.add_argument('--output',
+                        choices=["text", "json"],
+                        default="text",
+                        help="Print the build order as a comma separated list, or as a single line of json with "
+                             "the build waves and the critical path length of every feedstock")
+    parser.add_argument('--durations',
+                        default=None,
+                        help="Json file of historical build durations per feedstock, used to weigh the critical "
+                             "paths of the json output. Feedstocks without a duration weigh 1")
     return parser
 
 
 github_base_url = "https://raw.githubusercontent.com"
 session = requests.Session()
+fetcher = ConditionalFetcher(session)
+# Platforms to render recipes for; without --archs only target_platform is set, like we always did
+selector_dicts = {'linux-64': {'target_platform': 'linux-64'}}
+recipe_store = None
+outputs_index = None
+fast_render = False
 
 
 def include_dependency(dep):
@@ -128,69 +326,64 @@ def include_dependency(dep):
     We exclude some packages that we had trouble with. Not sure if these should all be excluded
     Length less than 3 is excluded because feedstock-outputs expects package name to be at least 3 chars
     """
-    return not (dep == "python" or
-                dep.startswith("ctng-compilers-") or
-                dep.startswith("_") or
-                dep.startswith("r-") or
-                dep == "None" or
-                len(dep) < 3 or
-                dep in get_pinned_packages())
-
-
-def generate_initial_roots(feedstocks_csv):
-    for feedstock in feedstocks_csv.split(","):
-        if feedstock:
-            package_name = feedstock[:-10]
-            metadata = get_metadata(package_name)
-            if not metadata:
-                print("unable to locate the {} feedstock on conda-forge".format(package_name))
-                continue
-            yield (feedstock, metadata)
-
+    return get_dependency_policy().includes(dep)
 
-def filter_map(f, source):
-    return filter(lambda item: f(item[0], item[1]), source.items())
-
-
-@cached(metadata_cache)
-def get_pinned_packages():
-    # We don't want to include any packages that are pinned by anacondarecipes
-    with open('conda_build_config_anacondarecipes.yaml') as f:
-        my_list = yaml.safe_load(f)
-
-    for p in excluded_packages:
-        my_list[p] = ""
-
-    return ','.join(my_list)
-
-
-# Start the program.
-if __name__ == "__main__":
-    # Create parser
-    parser = create_parser()
-    # Get the parsed arguments and get to work!
-    args = parser.parse_args()
 
-    dependency_map: Dict[str, Set[str]] = {}
-    to_process = collections.deque()
+def generate_initial_roots(feedstocks_csv, executor, render_executor=None, chunksize=1):
+    feedstocks = [feedstock for feedstock in feedstocks_csv.split(",") if feedstock]
+    if render_executor is not None:
+        prerender([feedstock[:-10] for feedstock in feedstocks], executor, render_executor, chunksize)
+    for feedstock, metadata in zip(feedstocks, executor.map(lambda f: get_metadata(f[:-10]), feedstocks)):
+        if not metadata:
+            print("unable to locate the {} feedstock on conda-forge".format(feedstock[:-10]))
+            continue
+        yield (feedstock, metadata)
 
-    for feedstock, metadata in generate_initial_roots(args.feedstock_name):
-        if metadata is not None:
-            to_process.append((feedstock, metadata))
 
-    while to_process:
-        feedstock, metadata = to_process.popleft()
-        package_name = feedstock[:-10]
+def resolve_package(dep):
+    return lookup_feedstock_name(dep), get_metadata(dep)
 
-        # deps = extract_deps(metadata, package_name)
-        # Want only things with metadata as the dependencies of the current feedstock
-        # However, we also don't need to process anything already visited
-        deps = {lookup_feedstock_name(d): get_metadata(d) for d in extract_deps(metadata, package_name)}
-        dependency_feedstocks = {f"{d}-feedstock": metadata for d, metadata in deps.items() if metadata is not None and len(d) > 0}
-        dependency_map[feedstock] = set(dependency_feedstocks.keys())
-        if not args.sort_only:
-            to_process.extend([(d, metadata) for d, metadata in dependency_feedstocks.items() if d not in dependency_map])
 
+def crawl(roots, executor, sort_only=False, render_executor=None, chunksize=1, known=frozenset()):
+    """
+    Breadth first crawl of the dependency tree starting at the roots.
+    Each level of the tree is resolved concurrently on the executor before moving on to the next one.
+    With a render executor, the recipes of a level are rendered on it as one batch.
+    Feedstocks in known are not crawled any further.
+    Returns the dependency map of every platform, including everything crawled along the way.
+    """
+    dependency_maps: Dict[str, Dict[str, Set[str]]] = {arch: {} for arch in selector_dicts}
+    visited = set()
+    frontier = dict(roots)
+
+    while frontier:
+        # Sorted so that, like the serial crawl, the last package wins when two
+        # dependencies are provided by the same feedstock
+        level = {
+            (feedstock, arch): sorted(extract_deps(recipe, feedstock[:-10]))
+            for feedstock, metadata in frontier.items()
+            for arch, recipe in metadata.items()
+        }
+        packages = sorted({dep for deps in level.values() for dep in deps})
+        if render_executor is not None:
+            prerender(packages, executor, render_executor, chunksize)
+        resolved = dict(zip(packages, executor.map(resolve_package, packages)))
+
+        visited.update(frontier)
+        frontier = {}
+        for (feedstock, arch), deps in level.items():
+            # Want only things with metadata as the dependencies of the current feedstock
+            dependency_feedstocks = {f"{d}-feedstock": metadata for d, metadata in map(resolved.get, deps) if metadata is not None and len(d) > 0}
+            dependency_maps[arch][feedstock] = set(dependency_feedstocks.keys())
+            if not sort_only:
+                frontier.update(dependency_feedstocks)
+        # We don't need to process anything already visited
+        frontier = {d: metadata for d, metadata in frontier.items() if d not in visited and d not in known}
+
+    return dependency_maps
+
+
+def build_order(dependency_map, feedstocks_csv, sort_only=False):
     dependency_order = [
         feedstock
         for group in sort.topological_sort(dependency_map)
@@ -200,14 +393,14 @@ if __name__ == "__main__":
     ]
 
     # Always include the input even if we couldn't find the recipe for whatever reason
-    for feedstock in args.feedstock_name.split(","):
+    for feedstock in feedstocks_csv.split(","):
         if feedstock not in dependency_order:
             dependency_order.append(feedstock)
 
     # If we only want to sort the given input, remove everything else
-    if args.sort_only:
+    if sort_only:
         to_remove = []
-        feedstocks = args.feedstock_name.split(",")
+        feedstocks = feedstocks_csv.split(",")
         for feedstock in dependency_order:
             if feedstock not in feedstocks:
                 to_remove.append(feedstock)
@@ -215,5 +408,206 @@ if __name__ == "__main__":
         for feedstock in to_remove:
             dependency_order.remove(feedstock)
 
-    print(",".join(dependency_order))
+    return dependency_order
+
+
+def build_plan(dependency_map, feedstocks_csv, sort_only=False, durations=None):
+    """
+    Build order that keeps the waves of feedstocks which can be built in parallel and the cycles which have to be
+    built together, with the critical path length of every feedstock to build the longest chains first.
+    """
+    groups = list(sort.topological_sort(dependency_map))
+    priorities = sort.critical_paths(dependency_map, groups, durations)
+    feedstocks = [feedstock for feedstock in feedstocks_csv.split(",") if feedstock]
+    waves = [
+        {"feedstocks": sorted(group.members), "cycle_edges": {k: sorted(v) for k, v in sorted(group.cycle_edges.items())}}
+        for group in groups
+    ]
+    # Always include the input even if we couldn't find the recipe for whatever reason
+    missing = [feedstock for feedstock in feedstocks if feedstock not in priorities]
+    if missing:
+        waves.append({"feedstocks": missing, "cycle_edges": {}})
+        priorities.update({feedstock: (durations or {}).get(feedstock, 1) for feedstock in missing})
+
+    # If we only want to sort the given input, remove everything else
+    if sort_only:
+        for wave in waves:
+            wave["feedstocks"] = [feedstock for feedstock in wave["feedstocks"] if feedstock in feedstocks]
+            wave["cycle_edges"] = {
+                feedstock: [dep for dep in deps if dep in feedstocks]
+                for feedstock, deps in wave["cycle_edges"].items() if feedstock in feedstocks
+            }
+        waves = [wave for wave in waves if wave["feedstocks"]]
+
+    return {
+        "order": [feedstock for wave in waves for feedstock in wave["feedstocks"]],
+        "waves": waves,
+        "priorities": {feedstock: priorities[feedstock] for wave in waves for feedstock in wave["feedstocks"]},
+    }
+
+
+def filter_map(f, source):
+    return filter(lambda item: f(item[0], item[1]), source.items())
+
+
+@cached(config_cache, key=lambda: hashkey("dependency_policy"), lock=cache_lock)
+def get_dependency_policy():
+    # We don't want to include any packages that are pinned by anacondarecipes
+    return DependencyPolicy.from_files(
+        ['conda_build_config_anacondarecipes.yaml'],
+        excluded_packages,
+        'blocklist.yaml',
+        names=["python", "None"],
+        prefixes=["ctng-compilers-", "_", "r-"],
+        min_length=3,
+    )
+
 
+@cached(config_cache, key=lambda: hashkey("manifest_entries"), lock=cache_lock)
+def get_manifest_entries():
+    return manifest.read_entries('manifest.yaml')
+
+
+def get_revision(feedstock):
+    """
+    Revision of a feedstock for the dependency graph: its commit in manifest.yaml, or the ETag of its recipe if it
+    isn't in the manifest. None if neither is known.
+    """
+    commit = get_manifest_entries().get(feedstock, {}).get("commit")
+    if commit:
+        return commit
+    response = fetcher.get(recipe_url(feedstock))
+    if response.status_code == 200 and response.etag:
+        return f"etag:{response.etag}"
+    return None
+
+
+def get_graph_config():
+    # Everything besides the recipes that decides which edges we find
+    return pinnings_hash(
+        selector_dicts,
+        [RENDER_SOURCE, 'conda_build_config.yaml', 'conda_build_config_anacondarecipes.yaml', 'blocklist.yaml'],
+    )
+
+
+def crawl_incremental(graph, feedstocks_csv, changed, executor, sort_only=False, render_executor=None, chunksize=1):
+    """
+    Bring the graph up to date for the given feedstocks by crawling only the ones that are new or changed, the
+    dependencies the graph has but never crawled, and whatever new feedstocks they depend on.
+    With sort_only the dependencies aren't crawled, so the graph is left as it is.
+    Returns the dependency map of every platform like crawl.
+    """
+    feedstocks = [feedstock for feedstock in feedstocks_csv.split(",") if feedstock]
+    # Only what the input reaches matters to this run
+    reached = sorted(graph.reachable(feedstocks))
+    changed = set(changed).union(graph.stale(dict(zip(reached, executor.map(get_revision, reached)))))
+    to_crawl = [feedstock for feedstock in feedstocks if feedstock not in graph or feedstock in changed]
+    to_crawl += sorted(feedstock for feedstock in changed if feedstock in graph and feedstock not in to_crawl)
+    if not sort_only:
+        to_crawl += sorted(graph.missing(reached).difference(to_crawl))
+    roots = list(generate_initial_roots(",".join(to_crawl), executor, render_executor, chunksize))
+    known = {feedstock for feedstock in graph.commits if feedstock not in changed}
+    dependency_maps = crawl(roots, executor, sort_only, render_executor, chunksize, known)
+    if sort_only:
+        return {arch: {**graph.edges[arch], **dependency_maps.get(arch, {})} for arch in graph.edges}
+    crawled = sorted({feedstock for dependency_map in dependency_maps.values() for feedstock in dependency_map})
+    graph.update(to_crawl, dependency_maps, dict(zip(crawled, executor.map(get_revision, crawled))))
+    return graph.edges
+
+
+@cached(config_cache, key=lambda arch: hashkey("pinnings_hash", arch), lock=cache_lock)
+def get_pinnings_hash(arch):
+    return pinnings_hash(selector_dicts[arch], [RENDER_SOURCE])
+
+
+# Start the program.
+if __name__ == "__main__":
+    # Create parser
+    parser = create_parser()
+    # Get the parsed arguments and get to work!
+    args = parser.parse_args()
+
+    if args.archs:
+        selector_dicts = {arch: platform_selectors(arch) for arch in args.archs.split()}
+    if args.recipe_store:
+        recipe_store = RecipeStore(args.recipe_store)
+    if args.outputs_index:
+        outputs_index = OutputsIndex(args.outputs_index)
+    fast_render = args.fast_render
+
+    try:
+        caches.registry.configure(args.cache_sizes)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    template_cache_args = (args.template_cache, args.template_cache_size * 1024 * 1024)
+    configure_template_cache(*template_cache_args)
+
+    session.mount("https://", HTTPAdapter(pool_maxsize=args.workers))
+    fetcher = ConditionalFetcher(session, args.http_cache)
+    render_executor = None
+    if args.render_workers > 0:
+        render_executor = ProcessPoolExecutor(
+            max_workers=args.render_workers,
+            initializer=configure_template_cache,
+            initargs=template_cache_args,
+        )
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        if args.graph:
+            graph = DependencyGraph.load(args.graph, get_graph_config(), selector_dicts)
+            dependency_maps = crawl_incremental(
+                graph,
+                args.feedstock_name,
+                [feedstock for feedstock in args.changed.split(",") if feedstock],
+                executor,
+                args.sort_only,
+                render_executor,
+                args.render_chunksize,
+            )
+            if not args.sort_only:
+                graph.save(args.graph)
+        else:
+            roots = list(generate_initial_roots(args.feedstock_name, executor, render_executor, args.render_chunksize))
+            dependency_maps = crawl(roots, executor, args.sort_only, render_executor, args.render_chunksize)
+    if render_executor is not None:
+        render_executor.shutdown()
+    fetcher.save()
+    # Only keep what is reachable from the input on each platform
+    inputs = args.feedstock_name.split(",")
+    dependency_maps = {
+        arch: {feedstock: dependency_map[feedstock] for feedstock in inputs if feedstock in dependency_map}
+        if args.sort_only else sort.reachable(dependency_map, inputs)
+        for arch, dependency_map in dependency_maps.items()
+    }
+    if args.template_cache:
+        print("Template cache: " + ", ".join(f"{key}={value}" for key, value in template_cache_stats().items()))
+    if args.cache_stats:
+        for line in caches.registry.stats_lines():
+            print(line)
+        print("Recipe requests: " + ", ".join(f"{key}={value}" for key, value in fetcher.stats().items()))
+
+    combined_map: Dict[str, Set[str]] = {}
+    for dependency_map in dependency_maps.values():
+        for feedstock, dependencies in dependency_map.items():
+            combined_map.setdefault(feedstock, set()).update(dependencies)
+
+    if args.output == "json":
+        durations = None
+        if args.durations:
+            with open(args.durations) as f:
+                durations = json.load(f)
+        plan = build_plan(combined_map, args.feedstock_name, args.sort_only, durations)
+        if len(dependency_maps) > 1:
+            plan["archs"] = {
+                arch: build_plan(dependency_map, args.feedstock_name, args.sort_only, durations)
+                for arch, dependency_map in dependency_maps.items()
+            }
+        # Printed as the last line, like the plain order
+        print(json.dumps(plan))
+    else:
+        if len(dependency_maps) > 1:
+            for arch, dependency_map in dependency_maps.items():
+                print(f"{arch}: " + ",".join(build_order(dependency_map, args.feedstock_name, args.sort_only)))
+
+        # The last line is the order for all platforms combined
+        print(",".join(build_order(combined_map, args.feedstock_name, args.sort_only)))
@@ -0,0 +1,105 @@
+# Persisted feedstock dependency graph.
+# Holds the dependencies of every feedstock crawled so far, per platform, together with the revision each one was
+# crawled at: its manifest commit, or the ETag of its recipe for feedstocks that aren't in the manifest. A later crawl
+# only needs to revisit the feedstocks that changed since, and those the graph has edges to but never crawled, and can
+# sort the rest straight from the graph.
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, Optional, Set
+
+
+class DependencyGraph:
+    def __init__(self, config: str, archs: Iterable[str]):
+        #: Hash of the configuration the graph was crawled with; a graph crawled differently is discarded on load
+        self.config = config
+        self.edges: Dict[str, Dict[str, Set[str]]] = {arch: {} for arch in archs}
+        #: Revision every feedstock was crawled at, None if it couldn't be told
+        self.commits: Dict[str, Optional[str]] = {}
+
+    def __contains__(self, feedstock: str) -> bool:
+        return feedstock in self.commits
+
+    @classmethod
+    def load(cls, path: str, config: str, archs: Iterable[str]) -> "DependencyGraph":
+        graph = cls(config, archs)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return graph
+        if data.get("config") != config or set(data.get("edges", {})) != set(graph.edges):
+            return graph
+        graph.commits = data["commits"]
+        graph.edges = {
+            arch: {feedstock: set(dependencies) for feedstock, dependencies in dependency_map.items()}
+            for arch, dependency_map in data["edges"].items()
+        }
+        return graph
+
+    def save(self, path: str):
+        data = {
+            "config": self.config,
+            "commits": self.commits,
+            "edges": {
+                arch: {feedstock: sorted(dependencies) for feedstock, dependencies in dependency_map.items()}
+                for arch, dependency_map in self.edges.items()
+            },
+        }
+        # Write to a temporary file first so an interrupted run doesn't leave a truncated graph behind
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def stale(self, revisions: Dict[str, Optional[str]]) -> Set[str]:
+        """Feedstocks of the graph among the given ones that aren't at the revision they were crawled at anymore"""
+        return {
+            feedstock for feedstock, revision in revisions.items()
+            if feedstock in self.commits and (revision is None or self.commits[feedstock] != revision)
+        }
+
+    def missing(self, feedstocks: Iterable[str]) -> Set[str]:
+        """Dependencies of the given feedstocks that were never crawled themselves"""
+        return {
+            dependency
+            for dependency_map in self.edges.values()
+            for feedstock in feedstocks
+            for dependency in dependency_map.get(feedstock, ())
+            if dependency not in self.commits
+        }
+
+    def reachable(self, feedstocks: Iterable[str]) -> Set[str]:
+        """The given feedstocks that are in the graph and everything they depend on, on any platform"""
+        reached = set()
+        to_visit = [feedstock for feedstock in feedstocks if feedstock in self.commits]
+        while to_visit:
+            feedstock = to_visit.pop()
+            if feedstock in reached:
+                continue
+            reached.add(feedstock)
+            for dependency_map in self.edges.values():
+                to_visit.extend(d for d in dependency_map.get(feedstock, ()) if d in self.commits and d not in reached)
+        return reached
+
+    def update(self, recrawled: Iterable[str], dependency_maps: Dict[str, Dict[str, Set[str]]],
+               revisions: Dict[str, Optional[str]]):
+        """
+        Replace the outgoing edges of the recrawled feedstocks with the ones in dependency_maps, and add any other
+        feedstock crawled along the way. Recrawled feedstocks missing from dependency_maps no longer have a recipe
+        and are dropped from the graph.
+        """
+        crawled = {feedstock for dependency_map in dependency_maps.values() for feedstock in dependency_map}
+        removed = set(recrawled).difference(crawled)
+        for feedstock in removed:
+            self.commits.pop(feedstock, None)
+        for arch, dependency_map in self.edges.items():
+            for feedstock in removed:
+                dependency_map.pop(feedstock, None)
+            if removed:
+                for dependencies in dependency_map.values():
+                    dependencies.difference_update(removed)
+            for feedstock, dependencies in dependency_maps.get(arch, {}).items():
+                dependency_map[feedstock] = set(dependencies)
+        for feedstock in crawled:
+            self.commits[feedstock] = revisions.get(feedstock)
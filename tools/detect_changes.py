@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Find the feedstocks whose upstream HEAD moved.
+# For every feedstock in the manifest, the HEAD of the upstream repo is compared with the HEAD of our fork and with the
+# commit recorded in manifest.yaml. The git ls-remote calls run on a bounded pool, with a timeout and retries, and
+# the URLs are templates so the whole thing can be pointed at local file:// repos.
+import argparse
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import manifest
+
+UPSTREAM_URL = "https://github.com/conda-forge/{feedstock}.git"
+FORK_URL = "https://github.com/anaconda-community/{feedstock}.git"
+
+
+def ls_remote(url: str, timeout: float = 30, retries: int = 2, backoff: float = 1) -> str:
+    """Commit HEAD points to in the remote repo, empty for an empty repo. Raises RuntimeError when it can't be read"""
+    # Never wait for credentials of a repo that doesn't exist
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    error = ""
+    for attempt in range(retries + 1):
+        try:
+            result = subprocess.run(
+                ["git", "ls-remote", url, "HEAD"], capture_output=True, text=True, timeout=timeout, env=env
+            )
+            if result.returncode == 0:
+                fields = result.stdout.split()
+                return fields[0] if fields else ""
+            error = result.stderr.strip() or f"git ls-remote exited with {result.returncode}"
+        except subprocess.TimeoutExpired:
+            error = f"timed out after {timeout}s"
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+    raise RuntimeError(f"{url}: {error}")
+
+
+def check_feedstock(feedstock: str, upstream_url: str, fork_url: str, timeout: float, retries: int
+                    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Upstream HEAD, fork HEAD and the error if either couldn't be read"""
+    try:
+        upstream = ls_remote(upstream_url.format(feedstock=feedstock), timeout, retries)
+        fork = ls_remote(fork_url.format(feedstock=feedstock), timeout, retries)
+    except RuntimeError as e:
+        return None, None, str(e)
+    return upstream, fork, None
+
+
+def detect_changes(entries: Dict[str, Dict[str, str]], upstream_url: str = UPSTREAM_URL, fork_url: str = FORK_URL,
+                   workers: int = 16, timeout: float = 30, retries: int = 2) -> dict:
+    """
+    Feedstocks whose upstream HEAD differs from our fork or from the commit in the manifest, with their upstream HEAD,
+    and the feedstocks that couldn't be checked.
+    """
+    feedstocks = sorted(entries)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda feedstock: check_feedstock(feedstock, upstream_url, fork_url, timeout, retries), feedstocks
+        )
+        commits = {}
+        errors = {}
+        for feedstock, (upstream, fork, error) in zip(feedstocks, results):
+            if error:
+                errors[feedstock] = error
+            elif upstream and (upstream != fork or upstream != entries[feedstock].get("commit")):
+                commits[feedstock] = upstream
+    return {"changed": list(commits), "commits": commits, "errors": errors}
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="detect_changes",
+        description="Print the feedstocks whose upstream HEAD changed as json."
+    )
+    parser.add_argument("-m", "--manifest", default="manifest.yaml", help="Path of the manifest")
+    parser.add_argument("-f", "--feedstocks", default="",
+                        help="Comma separated list of feedstocks to check. By default every feedstock in the manifest")
+    parser.add_argument("--upstream_url", default=UPSTREAM_URL, help="Template of the upstream repo urls")
+    parser.add_argument("--fork_url", default=FORK_URL, help="Template of the fork repo urls")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="Number of repos to check concurrently")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for a single git ls-remote")
+    parser.add_argument("--retries", type=int, default=2, help="Number of times to retry a failed git ls-remote")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    entries = manifest.read_entries(args.manifest)
+    if args.feedstocks:
+        entries = {feedstock: entries.get(feedstock, {}) for feedstock in args.feedstocks.split(",") if feedstock}
+    print(json.dumps(
+        detect_changes(entries, args.upstream_url, args.fork_url, args.workers, args.timeout, args.retries),
+        indent=2,
+    ))
@@ -0,0 +1,149 @@
+# HTTP fetch layer with conditional revalidation.
+# Response bodies are kept on disk together with their ETag/Last-Modified validators, in an index of our own, so later
+# runs can send If-None-Match/If-Modified-Since and reuse the cached body when the server answers 304 Not Modified.
+# Within a run every url is requested at most once: responses are kept in memory, and concurrent requests for a url
+# wait for the one already in flight instead of sending their own.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import requests
+
+
+class FetchResponse:
+    __slots__ = ("status_code", "reason", "text", "etag", "last_modified", "not_modified")
+
+    def __init__(self, status_code, reason, text, etag=None, last_modified=None, not_modified=False):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        # True when the body came from the cache after a 304
+        self.not_modified = not_modified
+
+
+class _Pending:
+    __slots__ = ("done", "response")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[FetchResponse] = None
+
+
+class ConditionalFetcher:
+    def __init__(self, session: requests.Session, cache_dir: Optional[str] = None):
+        self.session = session
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._validators: Dict[str, dict] = {}
+        # The response of every url requested this run, or the request still in flight
+        self._responses: Dict[str, _Pending] = {}
+        #: Requests sent, requests answered from memory instead, and responses that were 304 Not Modified
+        self.requests = 0
+        self.saved = 0
+        self.not_modified = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            try:
+                with open(self._index_path()) as f:
+                    self._validators = json.load(f)
+            except (OSError, ValueError):
+                self._validators = {}
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def _read_body(self, url) -> Optional[str]:
+        try:
+            with open(self._body_path(url), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_body(self, url, text):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self._body_path(url))
+
+    def get(self, url: str) -> FetchResponse:
+        """GET the url, revalidating against the cached copy when there is one, unless it was already requested this run"""
+        while True:
+            with self._lock:
+                pending = self._responses.get(url)
+                if pending is None:
+                    pending = self._responses[url] = _Pending()
+                    break
+            pending.done.wait()
+            if pending.response is not None:
+                with self._lock:
+                    self.saved += 1
+                return pending.response
+            # The request failed, so try again ourselves
+
+        try:
+            pending.response = self._get(url)
+        except BaseException:
+            with self._lock:
+                del self._responses[url]
+            raise
+        finally:
+            pending.done.set()
+        return pending.response
+
+    def _get(self, url: str) -> FetchResponse:
+        headers = {}
+        cached_body = None
+        if self.cache_dir:
+            validators = self._validators.get(url, {})
+            cached_body = self._read_body(url) if validators else None
+            if cached_body is not None:
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+
+        response = self.session.get(url, headers=headers, allow_redirects=False)
+        with self._lock:
+            self.requests += 1
+        if response.status_code == 304 and cached_body is not None:
+            validators = self._validators[url]
+            etag = response.headers.get("ETag", validators.get("etag"))
+            with self._lock:
+                self.not_modified += 1
+            return FetchResponse(200, "Not Modified", cached_body, etag, validators.get("last_modified"), True)
+
+        result = FetchResponse(
+            response.status_code,
+            response.reason,
+            response.text,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+        if response.status_code == 200:
+            with self._lock:
+                if self.cache_dir and (result.etag or result.last_modified):
+                    self._write_body(url, result.text)
+                    self._validators[url] = {"etag": result.etag, "last_modified": result.last_modified}
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "saved": self.saved, "not_modified": self.not_modified}
+
+    def save(self):
+        """Persist the validators so the next run can revalidate"""
+        if not self.cache_dir:
+            return
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._validators, f)
+            os.replace(tmp_path, self._index_path())
@@ -2,18 +2,27 @@
 # This was modified from https://github.com/anaconda-distribution/distro-incubator/blob/main/akabanovs/pkg_check_availability/pkg_check_availability.py
 import argparse
 import json
-import operator
 import os
 import re
+import threading
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import requests
-import yaml
-from cachetools import Cache, LRUCache, cached
-from pkg_resources import parse_version
-from render import render
-
-cache: Cache = LRUCache(maxsize=1000)
+from cachetools import cachedmethod
+from cachetools.keys import hashkey
+import caches
+import manifest
+from fetch import ConditionalFetcher
+from outputs_index import OutputsIndex
+from policy import DependencyPolicy
+from recipe_store import RecipeStore, pinnings_hash
+from repodata import load_index
+from versions import compile_spec
+from render import (
+    RENDER_SOURCE, configure_template_cache, platform_selectors, recipe_deps, render_deps_multi, render_many,
+    render_multi, template_cache_stats, verify_fast_render
+)
 
 warnings.simplefilter("ignore")
 
@@ -31,418 +40,527 @@ excluded_packages = [
     "openblas","ice","gdal","arrow","boost","llvm","gcc","python","numpy","protobuf","abseil","thrift","hdf5","netcdf"
 ]
 github_base_url = "https://raw.githubusercontent.com"
+main_channel_url = "https://repo.anaconda.com/pkgs/main"
+published_channel_url = "https://staging.continuum.io/community/dev"
 username = os.getenv("GIT_USERNAME")
 token = os.getenv("GIT_TOKEN")
-avail_pkg = []
-unavail_pkg = []
-
-missing_deps = []
-outdated_deps = []
-check_manually = []
-session = requests.Session()
-rdata = {}
-ordered_feedstocks = dict()
-parent = ""
+# Platforms to render recipes for unless archs are given; we only render for linux-64
+default_selector_dicts = {'linux-64': {'target_platform': 'linux-64', 'ctng_target_platform': 'linux-64'}}
+# Build tools and platform packages we never build ourselves, by name and by prefix
+skipped_deps = {
+    "python", "make", "help2man", "autoconf", "automake", "m4", "libtool", "m2-patch", "patch", "vs2015_runtime",
+    "posix", "crt-git", "setuptools", "wheel", "autotools_clang_conda",
+}
+skipped_prefixes = ("ctng-compilers-", "_", "cross-python", "m2", "automake")
+# Memory budget of the resolver's caches, one per cached method
+cache_budgets = {
+    "raw_text_load": 1024 * caches.MB,
+    "get_deps": 256 * caches.MB,
+    "recipe_status": 16 * caches.MB,
+    "is_recipe_available": 16 * caches.MB,
+    "lookup_feedstock_name": 16 * caches.MB,
+    "resolve_dependency": 32 * caches.MB,
+    "check_versions": 32 * caches.MB,
+    "manifest_entries": 64 * caches.MB,
+    "pinnings_hash": 1 * caches.MB,
+    "published": 1 * caches.MB,
+}
 
 
 def ver_in_range(verCand, verRange):
-    inRange = True
-    if verRange != " ":
-        for verPart in verRange.split(","):
-            if ">=" in verPart:
-                op = operator.ge
-                ver = verPart.split(">=")[1]
-            elif ">" in verPart:
-                op = operator.gt
-                ver = verPart.split(">")[1]
-            elif "<=" in verPart:
-                op = operator.le
-                ver = verPart.split("<=")[1]
-            elif "<" in verPart:
-                op = operator.lt
-                ver = verPart.split("<")[1]
-            elif "!=" in verPart:
-                op = operator.ne
-                ver = verPart.split("!=")[1]
-            elif "==" in verPart:
-                op = operator.eq
-                ver = verPart.split("==")[1]
-            elif "=" in verPart:
-                op = operator.eq
-                ver = verPart.split("=")[1]
-            else:
-                op = operator.eq
-                ver = verPart
-            if not op(parse_version(verCand), parse_version(ver)):
-                inRange = False
-                break
-    return inRange
-
-
-def get_published():
-    r = requests.get('https://staging.continuum.io/community/dev/noarch/repodata.json')
-    my_list = yaml.safe_load(r.content)
-    published = dict()
-    for x in my_list['packages']:
-        published[re.sub(r'-\d+\.\d+.*\.tar\.bz2', '', x)] = 'yes'
-    return published
-
-
-def get_requirements(data, name, section, attribute):
-    reqs = data.get(section, {}).get(attribute, [])
-    if section == "requirements":
-        for out in data.get("outputs", {}):
-            reqs = reqs + out.get(section, {}).get(attribute, [])
-    return reqs
+    return compile_spec(verRange).contains(verCand)
 
 
-def read_requirements(data, name, section, attribute):
-    try:
-        req = get_requirements(data, name, section, attribute)
-        if not isinstance(req, list):
-            req = []
-    except:
-        req = []
-    return req
-
+def scan_arch(dep, ver_range, index):
+    available = dep in index
+    in_range = False
+    if available and ver_range:
+        in_range = compile_spec(ver_range).any_of(index.version_keys(dep))
+    return available, in_range
 
-@cached(cache)
-def is_recipe_available(pkg_name: str, lookup: bool):
-    if pkg_name.startswith("ctng-compilers-"):
-        return False, ""
 
-    # We already verified recipe, just move package in build order
-    if f"{pkg_name}-feedstock" in ordered_feedstocks.keys():
-        ordered_feedstocks.pop(f"{pkg_name}-feedstock")
-    # If we haven't processed then lookup recipe
-    else:
-        url = f"{github_base_url}/conda-forge/{pkg_name}-feedstock/main/recipe/meta.yaml"
+def split_dep(key):
+    """Name and version range of a dependency"""
+    dep = key.split()
+    return dep[0], dep[1] if len(dep) > 1 else ""
+
+
+class Resolver:
+    """
+    Finds the feedstocks a set of feedstocks depends on and the order to build them in.
+    Recipe lookups, renders and dependency resolutions are cached on the resolver and have no side effects, so one
+    resolver can answer any number of queries; the build order of each query is worked out from the cached results.
+    """
+
+    def __init__(self, archs=None, check_version_check_selector=False, recipe_store=None, outputs_index=None,
+                 http_cache=None, repodata_cache=None, manifest_path="manifest.yaml", session=None, policy=None,
+                 cache_sizes=None, fast_render=False):
+        self.archs = list(archs) if archs else supported_archs.copy()
+        self.check_version_check_selector = check_version_check_selector
+        self.recipe_store = recipe_store
+        self.outputs_index = outputs_index
+        self.repodata_cache = repodata_cache
+        self.manifest_path = manifest_path
+        # Read requirements with the fast path of render_deps_multi; nothing is added to the recipe store then
+        self.fast_render = fast_render
+        self.session = session or requests.Session()
+        self.fetcher = ConditionalFetcher(self.session, http_cache)
+        self.caches = caches.CacheRegistry()
+        for name, max_bytes in cache_budgets.items():
+            self.caches.namespace(name, max_bytes)
+        self.caches.configure(cache_sizes or {})
+        # Lookups run from thread pools, and the caches have no lock of their own
+        self._cache_lock = threading.RLock()
+        # We don't follow pinned packages, the ones we had trouble with, nor build tools
+        self.policy = policy or DependencyPolicy.from_files(
+            ['conda_build_config.yaml'], excluded_packages, 'blocklist.yaml', skipped_deps, skipped_prefixes
+        )
+        # Render every recipe once per platform so dependencies can be told apart per arch
+        self.selector_dicts = default_selector_dicts
+        if archs:
+            rendered_archs = [arch for arch in self.archs if arch != "noarch"]
+            if rendered_archs:
+                self.selector_dicts = {arch: platform_selectors(arch) for arch in rendered_archs}
+        #: Every package whose dependencies were read, with its feedstock and its dependencies
+        self.packages = {}
+        #: Repodata index of every arch we check
+        self.rdata = {}
+        # Availability per arch is only looked up when checking versions and selectors
+        if check_version_check_selector:
+            self.load_repodata()
+
+    def load_repodata(self, workers=8):
+        """Index the main channel's repodata of the archs (and noarch) into rdata"""
+        subdirs = sorted(set(self.archs).union(["noarch"]))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            indexes = executor.map(
+                lambda subdir: load_index(main_channel_url, subdir, self.repodata_cache, self.session), subdirs
+            )
+            self.rdata.update(zip(subdirs, indexes))
+
+    @cachedmethod(lambda self: self.caches["published"], lock=lambda self: self._cache_lock)
+    def published(self):
+        return load_index(published_channel_url, "noarch", self.repodata_cache, self.session).names()
+
+    @cachedmethod(lambda self: self.caches["manifest_entries"], lock=lambda self: self._cache_lock)
+    def manifest_entries(self):
+        return manifest.read_entries(self.manifest_path)
+
+    @cachedmethod(lambda self: self.caches["pinnings_hash"], lock=lambda self: self._cache_lock)
+    def pinnings_hash(self, arch):
+        return pinnings_hash(self.selector_dicts[arch], [RENDER_SOURCE])
+
+    @cachedmethod(lambda self: self.caches["recipe_status"], lock=lambda self: self._cache_lock)
+    def recipe_status(self, pkg_name):
+        """Status of the request for the feedstock's recipe, None if the request failed"""
+        # The same url locate_recipe reads the recipe from, so the probe's response is reused there
         try:
-            response = session.get(url, allow_redirects=False)
+            return self.fetcher.get(self.recipe_url(f"{pkg_name}-feedstock")).status_code
         except:
+            return None
+
+    @cachedmethod(lambda self: self.caches["is_recipe_available"], lock=lambda self: self._cache_lock)
+    def is_recipe_available(self, pkg_name: str, lookup: bool):
+        if pkg_name.startswith("ctng-compilers-"):
             return False, ""
+        status = self.recipe_status(pkg_name)
+        if status == 200:
+            return True, "main"
+        if status is not None and lookup:
+            return self.is_recipe_available(self.lookup_feedstock_name(pkg_name), False)
+        return False, ""
+
+    def load_stored(self, feedstock, revision):
+        """The stored renders for every platform, or None unless all of them are in the recipe store"""
+        data = {
+            arch: self.recipe_store.get(feedstock, revision, arch, self.pinnings_hash(arch))
+            for arch in self.selector_dicts
+        }
+        return data if all(rendered is not None for rendered in data.values()) else None
+
+    def recipe_url(self, feedstock, branch="main"):
+        # Feedstocks in manifest.yaml are read at their commit there, which is also what their render is stored under
+        commit = self.manifest_entries().get(feedstock, {}).get("commit")
+        return f"{github_base_url}/conda-forge/{feedstock}/{commit or branch}/recipe/meta.yaml"
+
+    def locate_recipe(self, name, branch, lookup):
+        """
+        Find the recipe of a feedstock, following the feedstock-outputs lookup if needed.
+        Returns (feedstock, revision, data, text) where data is only set if the renders were already stored
+        and text is the raw recipe otherwise, or None if there is no recipe.
+        """
+        entry = self.manifest_entries().get(f"{name}-feedstock", {})
+        # Feedstocks in the manifest have a known commit, so their render can be reused across runs
+        commit = entry.get("commit") if self.recipe_store is not None else None
+        if commit:
+            data = self.load_stored(f"{name}-feedstock", commit)
+            if data is not None:
+                return f"{name}-feedstock", commit, data, None
+        response = self.fetcher.get(self.recipe_url(f"{name}-feedstock", branch))
         if response.status_code != 200:
             if lookup:
-                return is_recipe_available(lookup_feedstock_name(pkg_name), False)
-            return False, ""
-    ordered_feedstocks[f"{pkg_name}-feedstock"] = parent
-    return True, "main"
-
-
-@cached(cache)
-def raw_text_load(name, branch, lookup):
-    url = f"{github_base_url}/conda-forge/{name}-feedstock/{branch}/recipe/meta.yaml"
-    response = session.get(url, allow_redirects=False)
-    if response.status_code != 200:
-        if lookup:
-            return raw_text_load(lookup_feedstock_name(name), branch, False)
-        print(f"Error [{response.status_code}]: {response.reason}")
-        return ""
-    env_string = response.text
-    return render(env_string, {'target_platform': 'linux-64', 'ctng_target_platform': 'linux-64'})
-
-
-@cached(cache)
-def get_deps(name, branch):
-    pinned = get_pinned_packages()
-    if name in pinned:
-        return {}, "0"
-    try:
-        data = raw_text_load(name, branch, True)
-        if data == "":
-            return {}, "0"
-    except:
-        return {}, "0"
-    # Get collection of required dependencies (may not be unique)
-    deps_collection = read_requirements(data, name, "requirements", "build") \
-                      + read_requirements(data, name, "requirements", "run") \
-                      + read_requirements(data, name, "requirements", "host")
-
-    deps_dict = {}
-    if len(deps_collection) > 0:
-        for dep in deps_collection:
-            if dep not in deps_dict and isinstance(dep, str) and dep not in pinned:
-                deps_dict[dep] = []
-    return deps_dict, get_requirements(data, name, "package", "version")
-
-
-def guess_feedstock_name(dep, separator, checksep):
-    if not separator in dep:
-        return False, dep, ""
-    dep = dep.replace(separator, checksep)
-    depname_split = dep.split(separator)
-    for ind, check_dep in reversed(list(enumerate(depname_split))):
-        partOfPKG = separator.join(depname_split[: ind + 1])
-        repo_avail, def_branch = is_recipe_available(partOfPKG, True)
-        if repo_avail:
-            # Found the repo! Now need to check if the package is mentioned here
+                return self.locate_recipe(self.lookup_feedstock_name(name), branch, False)
+            print(f"Error [{response.status_code}]: {response.reason}")
+            return None
+        # Otherwise the ETag identifies the recipe, which lets us reuse the render after a 304
+        revision = commit or (f"etag:{response.etag}" if response.etag else None)
+        if self.recipe_store is not None and revision and not commit:
+            data = self.load_stored(f"{name}-feedstock", revision)
+            if data is not None:
+                return f"{name}-feedstock", revision, data, None
+        return f"{name}-feedstock", revision, None, response.text
+
+    def store_rendered(self, feedstock, revision, rendered_platforms):
+        data = dict(zip(self.selector_dicts, rendered_platforms))
+        if self.recipe_store is not None and revision:
+            for arch, rendered in data.items():
+                if isinstance(rendered, dict):
+                    self.recipe_store.put(feedstock, revision, arch, self.pinnings_hash(arch), rendered)
+        return data
+
+    def render_recipe(self, name, branch, lookup):
+        """Full rendered recipe for every platform in selector_dicts. Not cached, see raw_text_load"""
+        recipe = self.locate_recipe(name, branch, lookup)
+        if recipe is None:
+            return ""
+        feedstock, revision, data, env_string = recipe
+        if data is None:
+            data = self.store_rendered(
+                feedstock, revision, render_multi(env_string, list(self.selector_dicts.values()))
+            )
+        return data
+
+    @cachedmethod(lambda self: self.caches["raw_text_load"], lock=lambda self: self._cache_lock)
+    def raw_text_load(self, name, branch, lookup):
+        """Requirements of the rendered recipe (a RecipeDeps) for every platform in selector_dicts"""
+        if not self.fast_render:
+            data = self.render_recipe(name, branch, lookup)
+            return recipe_deps(data) if data else data
+        recipe = self.locate_recipe(name, branch, lookup)
+        if recipe is None:
+            return ""
+        _, _, data, env_string = recipe
+        if data is not None:
+            return recipe_deps(data)
+        return dict(zip(self.selector_dicts, render_deps_multi(env_string, list(self.selector_dicts.values()))))
+
+    def prerender(self, names, branch, workers, render_executor, chunksize):
+        """
+        Fetch the recipes of the given packages with a thread pool, then render them as one batch on the render
+        executor, usually a process pool, and seed the raw_text_load cache with the results.
+        """
+        def locate(name):
             try:
-                data = raw_text_load(partOfPKG, def_branch, True)
-                if data is None:
-                    continue
-            except:
-                print(f"Error loading yaml for {partOfPKG}")
+                return self.locate_recipe(name, branch, True)
+            except Exception:
+                return False
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            located = list(zip(names, executor.map(locate, names)))
+        to_render = [(name, recipe) for name, recipe in located if recipe and recipe[2] is None]
+        rendered = render_many(
+            [(text, list(self.selector_dicts.values())) for _, (_, _, _, text) in to_render],
+            render_executor,
+            chunksize,
+            deps_only=self.fast_render,
+        )
+        # Like get_deps, a recipe that can't be fetched or rendered has no dependencies
+        results = {name: recipe_deps(recipe[2]) if recipe and recipe[2] else "" for name, recipe in located}
+        for (name, (feedstock, revision, _, _)), rendered_platforms in zip(to_render, rendered):
+            if rendered_platforms is None:
                 continue
-            for out in data.get("outputs", {}):
-                # Try both combinations
-                if str(out.get("name", {})) == dep:
-                    return True, partOfPKG, def_branch
-                if str(out.get("name", {})) == dep.replace(checksep, separator):
-                    return True, partOfPKG, def_branch
-    return False, dep, ""
+            if self.fast_render:
+                results[name] = dict(zip(self.selector_dicts, rendered_platforms))
+            else:
+                results[name] = recipe_deps(self.store_rendered(feedstock, revision, rendered_platforms))
+        with self._cache_lock:
+            for name, data in results.items():
+                try:
+                    self.caches["raw_text_load"][hashkey(name, branch, True)] = data
+                except ValueError:
+                    # Too large for the cache, raw_text_load will render it again
+                    pass
+
+    @cachedmethod(lambda self: self.caches["get_deps"], lock=lambda self: self._cache_lock)
+    def get_deps(self, name, branch):
+        """
+        Dependencies of a package, mapped to whether they are required on each rendered platform.
+        Also returns the package version.
+        """
+        if self.policy.excludes(name):
+            return {}, "0"
+        try:
+            data = self.raw_text_load(name, branch, True)
+            if data == "":
+                return {}, "0"
+        except:
+            return {}, "0"
 
+        deps_dict = {}
+        for arch, recipe in data.items():
+            # Required dependencies (may not be unique)
+            for dep in recipe.requirements() if recipe is not None else ():
+                if self.policy.includes(dep.split()[0]):
+                    deps_dict.setdefault(dep, dict.fromkeys(data, False))[arch] = True
+        recipe = next(iter(data.values()))
+        return deps_dict, recipe.version if recipe is not None else "0"
+
+    def guess_feedstock_name(self, dep, separator, checksep, probes):
+        if not separator in dep:
+            return False, dep, ""
+        dep = dep.replace(separator, checksep)
+        depname_split = dep.split(separator)
+        for ind, check_dep in reversed(list(enumerate(depname_split))):
+            partOfPKG = separator.join(depname_split[: ind + 1])
+            probes.append((partOfPKG, True))
+            repo_avail, def_branch = self.is_recipe_available(partOfPKG, True)
+            if repo_avail:
+                # Found the repo! Now need to check if the package is mentioned here
+                try:
+                    data = self.raw_text_load(partOfPKG, def_branch, True)
+                    if not data:
+                        continue
+                except:
+                    print(f"Error loading yaml for {partOfPKG}")
+                    continue
+                for recipe in data.values():
+                    for out_name in recipe.output_names() if recipe is not None else ():
+                        # Try both combinations
+                        if out_name == dep:
+                            return True, partOfPKG, def_branch
+                        if out_name == dep.replace(checksep, separator):
+                            return True, partOfPKG, def_branch
+        return False, dep, ""
 
-@cached(cache)
-def lookup_feedstock_name(dep):
-    try:
-        deplist = list(dep)
-        url = f"{github_base_url}/conda-forge/feedstock-outputs/main/outputs/{deplist[0]}/{deplist[1]}/{deplist[2]}/{dep}.json"
-        response = session.get(url, allow_redirects=False)
-        if response.status_code != 200:
-            print(f"Could not find feedstock at {url}")
-            print(f"Error [{response.status_code}]: {response.reason}")
+    @cachedmethod(lambda self: self.caches["lookup_feedstock_name"], lock=lambda self: self._cache_lock)
+    def lookup_feedstock_name(self, dep):
+        if self.outputs_index is not None:
+            feedstocks = self.outputs_index.lookup(dep)
+            if not feedstocks:
+                print(f"Could not find feedstock for {dep} in the outputs index")
+                return ""
+            return feedstocks[0]
+        try:
+            deplist = list(dep)
+            url = f"{github_base_url}/conda-forge/feedstock-outputs/main/outputs/{deplist[0]}/{deplist[1]}/{deplist[2]}/{dep}.json"
+            response = self.session.get(url, allow_redirects=False)
+            if response.status_code != 200:
+                print(f"Could not find feedstock at {url}")
+                print(f"Error [{response.status_code}]: {response.reason}")
+                return ""
+            return json.loads(response.text)["feedstocks"][0]
+        except:
             return ""
-        return json.loads(response.text)["feedstocks"][0]
-    except:
-        return ""
-
-
-def scan_arch(dep, ver_range, rdata):
-    available = False
-    in_range = False
-    for r in rdata["packages"].values():
-        if dep == r["name"]:
-            available = True
-            if ver_range:
-                if ver_in_range(r["version"], ver_range):
-                    in_range = True
-                    break
-    return available, in_range
-
-
-def print_level(deps, archSupport, prefix, check_version_check_selector, expand_tree):
-    for index, key in enumerate(deps.keys()):
-        # Construct the full prefix:
-        if index == len(deps) - 1:
-            br = "└──"
-            prefix2 = prefix + "    "
-            comment_prefix = "\n" + prefix + "    "
-        else:
-            br = "├──"
-            prefix2 = prefix + "│   "
-            comment_prefix = "\n" + prefix + "│   "
-        constrLine = prefix + br
-
-        if len(constrLine) >= 50:
-            continue
-
-        # Derive dependency's actual name and version range
-        dep = key.split()
-        ver_range = ""
-        if len(dep) > 1:
-            ver_range = dep[1]
-        if len(dep) == 0:
-            continue
-        dep = dep[0]
-        if dep.__eq__("python"):
-            continue
-        if dep.startswith("ctng-compilers-"):
-            continue
-        if dep.startswith("_"):
-            continue
-        if dep.startswith("cross-python"):
-            continue
-        if dep.startswith("m2"):
-            continue
-        if dep.__eq__("make"):
-            continue
-        if dep.__eq__("help2man"):
-            continue
-        if dep.__eq__("autoconf"):
-            continue
-        if dep.__eq__("automake"):
-            continue
-        if dep.__eq__("m4"):
-            continue
-        if dep.__eq__("libtool"):
-            continue
-        if dep.__eq__("m2-patch"):
-            continue
-        if dep.__eq__("patch"):
-            continue
-        if dep.__eq__("vs2015_runtime"):
-            continue
-        if dep.__eq__("posix"):
-            continue
-        if dep.__eq__("crt-git"):
-            continue
-        if dep.startswith("automake"):
-            continue
-        if dep.__eq__("setuptools"):
-            continue
-        if dep.__eq__("wheel"):
-            continue
-        if dep.__eq__("autotools_clang_conda"):
-            continue
-
-        # Construct line:
-        constrLine += dep
-        if check_version_check_selector:
-            constrLine += " " + ver_range
-
-        # Initialise vars related to dependency's architecture selectors
-        archSupportDep = archSupport.copy()
-        extraInfo = ""
-
-        # Further initialise some flags to track dependency availability
-        pkg_avail = False
-        repo_avail = True
-        pkg_avail_on_noarch = False
-
-        # Check if dependency is available and populate availability arrays
-        # print("Checking " + dep)
-        repo_avail, def_branch = is_recipe_available(dep, True)
-        if dep in avail_pkg:
-            pkg_avail = True
-        elif "conda" in dep:
-            repo_avail = False
-        else:
-            if dep not in unavail_pkg:
-                # conda forge sometimes uses '-' as a separator while we use '_', and vice versa. Check:
-                if not repo_avail:
-                    repo_avail, dep, def_branch = guess_feedstock_name(dep, "-", "-")
-                    if not repo_avail:
-                        repo_avail, dep, def_branch = guess_feedstock_name(dep, "-", "_")
-                    if not repo_avail:
-                        repo_avail, dep, def_branch = guess_feedstock_name(dep, "_", "_")
-                    if not repo_avail:
-                        repo_avail, dep, def_branch = guess_feedstock_name(dep, "_", "-")
-                    if repo_avail:
-                        constrLine += " (subpackage of " + dep + "-feedstock)"
 
+    @cachedmethod(lambda self: self.caches["resolve_dependency"], lock=lambda self: self._cache_lock)
+    def resolve_dependency(self, dep):
+        """
+        The package whose feedstock builds a dependency, as (available, package, branch, subpackage, probes), probes
+        being the (package, lookup) pairs whose recipe was looked for on the way.
+        conda-forge sometimes uses '-' as a separator while we use '_', and vice versa, so for a dependency without a
+        feedstock of its own we look for a feedstock with a shorter name that has it as an output.
+        """
+        probes = [(dep, True)]
+        repo_avail, def_branch = self.is_recipe_available(dep, True)
+        if "conda" in dep:
+            return False, dep, "", False, probes
         if repo_avail:
-            pkg_avail = is_recipe_available(dep, True)
-            if pkg_avail:
-                avail_pkg.append(dep)
-                depsOfdep, version = get_deps(
-                    dep,
-                    def_branch
-                )
-                print_level(
-                    depsOfdep,
-                    archSupportDep,
-                    prefix2,
-                    check_version_check_selector,
-                    expand_tree,
-                )
+            return True, dep, def_branch, False, probes
+        for separator, checksep in (("-", "-"), ("-", "_"), ("_", "_"), ("_", "-")):
+            repo_avail, dep, def_branch = self.guess_feedstock_name(dep, separator, checksep, probes)
+            if repo_avail:
+                return True, dep, def_branch, True, probes
+        return False, dep, "", False, probes
+
+    @cachedmethod(lambda self: self.caches["check_versions"], lock=lambda self: self._cache_lock)
+    def check_versions(self, dep, ver_range, archs):
+        """
+        Notes on the archs a dependency is missing from or doesn't meet the version range on, one per line, and
+        whether noarch has a suitable version instead.
+        """
+        ver_info = ""
+        arch_info = ""
+        for arch in archs:
+            available, in_range = scan_arch(dep, ver_range, self.rdata[arch])
+            if not available:
+                arch_info = (arch_info or "\n- Unavailable:") + arch + ";"
+            if available and (not in_range and ver_range):
+                ver_info = (ver_info or "\n- Version requirements not met:") + arch + ";"
+
+        # If not found for any of the specified archs, try searching on noarch channel:
+        on_noarch = False
+        if ver_info or arch_info:
+            available, in_range = scan_arch(dep, ver_range, self.rdata["noarch"])
+            if available:
+                on_noarch = in_range or not ver_range
+                arch_info += "\n- Available on noarch" + (" and version OK" if on_noarch else " but version NOT OK")
             else:
-                unavail_pkg.append(dep)
-                unavail_pkg.append(def_branch)
-
-        # Take into account (if specified) version range and (if specified) arch selectors:
-        if check_version_check_selector:
-            archSupportDep = []
-            verAvailInfo = ""
-            archAvailInfo = ""
-            for arch in archSupport:
-                if arch == "noarch":
+                arch_info += " noarch;"
+        return (ver_info + arch_info).split("\n")[1:], on_noarch
+
+    def package(self, name, branch):
+        """A package with its feedstock and the status of each of its dependencies"""
+        if name in self.packages:
+            return self.packages[name]
+        edges = []
+        for key, required in self.get_deps(name, branch)[0].items():
+            dep, ver_range = split_dep(key)
+            available, package, _, subpackage, _ = self.resolve_dependency(dep)
+            edge = {"name": dep, "version": ver_range, "package": package if available else None,
+                    "subpackage": subpackage, "status": "available" if available else "unknown", "notes": []}
+            if available and self.check_version_check_selector:
+                # Platforms we didn't render for are assumed to need the dependency
+                dep_archs = tuple(arch for arch in self.archs if arch != "noarch" and required.get(arch, True))
+                edge["notes"], on_noarch = self.check_versions(package, ver_range, dep_archs)
+                if edge["notes"] and not on_noarch:
+                    edge["status"] = "outdated"
+            edges.append(edge)
+        self.packages[name] = {"feedstock": f"{name}-feedstock", "branch": branch, "dependencies": edges}
+        return self.packages[name]
+
+    def _record(self, order, probed, pkg_name, lookup):
+        # A recipe moves to the end of the build order the first time it is looked for (with or without lookup)
+        if (pkg_name, lookup) in probed:
+            return
+        probed.add((pkg_name, lookup))
+        if pkg_name.startswith("ctng-compilers-"):
+            return
+        feedstock = f"{pkg_name}-feedstock"
+        if feedstock in order or self.recipe_status(pkg_name) == 200:
+            order.pop(feedstock, None)
+            order[feedstock] = None
+        elif lookup and self.recipe_status(pkg_name) is not None:
+            self._record(order, probed, self.lookup_feedstock_name(pkg_name), False)
+
+    def resolve(self, feedstocks, skip_published=False):
+        """
+        Walk the dependencies of the feedstocks depth first, reading those of every package once. Returns the
+        feedstocks that were found, those that weren't, every package reached and the order to build them in.
+        """
+        order = {}
+        probed = set()
+        reached = {}
+        roots = []
+        unlocated = []
+        for feedstock in feedstocks:
+            if feedstock == "":
+                continue
+            # Remove -feedstock
+            package_name = feedstock[:-10]
+            self._record(order, probed, package_name, True)
+            # Check if the package is accessible in the conda-forge channel
+            repo_avail, def_branch = self.is_recipe_available(package_name, True)
+            if not repo_avail:
+                unlocated.append(package_name)
+                continue
+            roots.append(package_name)
+            if package_name in reached:
+                continue
+            reached[package_name] = None
+            stack = [iter(self.package(package_name, def_branch)["dependencies"])]
+            while stack:
+                edge = next(stack[-1], None)
+                if edge is None:
+                    stack.pop()
                     continue
-                arch_req = deps[key][arch]
-                if arch_req:
-                    archSupportDep.append(arch)
-
-            # If package is present on anaconda.org (pkg_avail), do further refinement to see if it is
-            # available for a specific version range, also taking into account arch selectors:
-            if pkg_avail:
-                for arch in archSupportDep:
-                    available, in_range = scan_arch(dep, ver_range, rdata[arch])
-                    if not available:
-                        if not archAvailInfo:
-                            archAvailInfo = (
-                                comment_prefix
-                                + "- Unavailable:"
-                            )
-                        archAvailInfo += arch + ";"
-                    if available and (not in_range and ver_range):
-                        if not verAvailInfo:
-                            verAvailInfo = (
-                                comment_prefix
-                                + "- Version requirements not met:"
-                            )
-                        verAvailInfo += arch + ";"
-
-                # If not found for any of the specified archs, try searching on noarch channel:
-                if verAvailInfo or archAvailInfo:
-                    available, in_range = scan_arch(dep, ver_range, rdata["noarch"])
-                    if available:
-                        archAvailInfo += (
-                            comment_prefix
-                            + "- Available on noarch"
-                        )
-                        if in_range or not ver_range:
-                            pkg_avail_on_noarch = True
-                            archAvailInfo += (
-                                " and version OK"
-                            )
-                        else:
-                            archAvailInfo += (
-                                " but version NOT OK"
-                            )
-                    else:
-                        archAvailInfo += " noarch;"
-                extraInfo = verAvailInfo + archAvailInfo
-
-        # Finally, write info to screen
-        if pkg_avail:
-            if not extraInfo or pkg_avail_on_noarch:
-                if expand_tree:
-                    print(
-                        constrLine
-                        + " (\u2713)"
-                        + extraInfo
-                       
-                    )
+                available, package, def_branch, _, probes = self.resolve_dependency(edge["name"])
+                for probe in probes:
+                    self._record(order, probed, *probe)
+                if available and package not in reached:
+                    reached[package] = None
+                    stack.append(iter(self.package(package, def_branch)["dependencies"]))
+
+        order.pop("wheel-feedstock", None)
+        order.pop("setuptools-feedstock", None)
+        if skip_published:
+            for key in self.published():
+                order.pop(f"{key}-feedstock", None)
+        return {"roots": roots, "unlocated": unlocated, "packages": list(reached), "order": list(reversed(order))}
+
+    def tree_lines(self, name, expand_tree, shown):
+        """
+        Lines of the dependency tree of a resolved package, a package's dependencies above its own line. The
+        dependencies of a package are only listed the first time it comes up; after that, while it is in shown, it
+        is marked as repeated.
+        """
+        lines = []
+        edges = self.packages[name]["dependencies"]
+        # Every frame lists the dependencies of one package, then the line of the package itself
+        stack = [(edges, iter(enumerate(edges)), " ", None)]
+        shown.add(name)
+        while stack:
+            edges, items, prefix, package_line = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                if package_line is not None:
+                    lines.append(package_line)
+                continue
+            index, edge = item
+            if index == len(edges) - 1:
+                br, pad = "└──", "    "
             else:
-                print(constrLine + " (^)" + extraInfo)
-                if dep not in outdated_deps and not pkg_avail_on_noarch:
-                    outdated_deps.append(dep)
-        else:
-            if repo_avail:
-                def_branch = unavail_pkg[unavail_pkg.index(dep) + 1]
-                depsOfdep, version = get_deps(
-                    dep, def_branch
-                )
-                if ver_range and check_version_check_selector:
-                    if not ver_in_range(version, ver_range):
-                        extraInfo = (
-                            comment_prefix
-                            + "│   - Dependencies shown are for {} version {}.".format(
-                                dep, version
-                            )
-                        )
-                        extraInfo += (
-                            comment_prefix
-                            + "│     i.e. picked version does not match required version range - dependencies might be different."
-                        )
-                print(
-                    constrLine
-                    + " (!)"
-                    + extraInfo
-                   
-                )
-                if dep not in missing_deps:
-                    missing_deps.append(dep)
-                print_level(
-                    depsOfdep,
-                    archSupportDep,
-                    prefix2,
-                    check_version_check_selector,
-                    expand_tree,
-                )
+                br, pad = "├──", "│   "
+
+            line = prefix + br + edge["name"]
+            if self.check_version_check_selector:
+                line += " " + edge["version"]
+            if edge["package"] is None:
+                lines.append(line + " (?) ")
+                continue
+            if edge["subpackage"]:
+                line += " (subpackage of " + edge["package"] + "-feedstock)"
+
+            if edge["status"] == "outdated":
+                line += " (^)"
+            elif expand_tree:
+                line += " (✓)"
             else:
-                print(constrLine + " (?) ")
-                if dep not in check_manually:
-                    check_manually.append(dep)
+                line = None
+            package = self.packages[edge["package"]]
+            repeated = package["dependencies"] and edge["package"] in shown
+            if line is not None:
+                if repeated:
+                    line += " (repeated)"
+                line += "".join("\n" + prefix + pad + note for note in edge["notes"])
+
+            if not package["dependencies"] or repeated:
+                if line is not None:
+                    lines.append(line)
+            else:
+                shown.add(edge["package"])
+                stack.append((package["dependencies"], iter(enumerate(package["dependencies"])), prefix + pad, line))
+        return lines
+
+    def verify_fast_render(self, feedstocks, workers=8):
+        """
+        Read the recipes of the feedstocks with both the fast path and the full render. Returns how many renders had
+        each status of render.verify_fast_render, plus "unlocated" for recipes that couldn't be fetched, and the
+        mismatches as (feedstock, arch, fast, full).
+        """
+        def verify(feedstock):
+            response = self.fetcher.get(self.recipe_url(feedstock))
+            if response.status_code != 200:
+                return None
+            return verify_fast_render(response.text, list(self.selector_dicts.values()))
+
+        counts = dict.fromkeys(["fast", "fallback", "mismatch", "unlocated"], 0)
+        mismatches = []
+        feedstocks = [feedstock for feedstock in feedstocks if feedstock]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for feedstock, report in zip(feedstocks, executor.map(verify, feedstocks)):
+                if report is None:
+                    counts["unlocated"] += 1
+                    continue
+                for arch, (status, fast, full) in zip(self.selector_dicts, report):
+                    counts[status] += 1
+                    if status == "mismatch":
+                        mismatches.append((feedstock, arch, fast, full))
+        return counts, mismatches
+
+    def save(self):
+        """Persist the validators of the fetched recipes"""
+        self.fetcher.save()
 
 
 def check_dep_name(value):
@@ -498,27 +616,89 @@ def create_parser() -> argparse.ArgumentParser:
         help="Flag to expand the dependency tree and include those packages that are available.",
         action="store_true",
     )
+    parser.add_argument(
+        "--output",
+        choices=["text", "json"],
+        default="text",
+        help="Print the dependency trees and the build order as text, or as a single line of json with every \
+                     package, its feedstock and its dependencies with their status",
+    )
+    parser.add_argument(
+        "--recipe_store",
+        default=None,
+        help="Directory of a persistent store of rendered recipes. \
+                     Feedstocks whose commit in manifest.yaml is unchanged are not fetched again",
+    )
+    parser.add_argument(
+        "--outputs_index",
+        default=None,
+        help="Local feedstock-outputs index built by outputs_index.py. \
+                     Used instead of querying conda-forge/feedstock-outputs over the network",
+    )
+    parser.add_argument(
+        "--http_cache",
+        default=None,
+        help="Directory to keep fetched recipes in. \
+                     Cached recipes are revalidated with If-None-Match/If-Modified-Since instead of downloaded again",
+    )
+    parser.add_argument(
+        "--render_workers",
+        type=int,
+        default=0,
+        help="Number of processes to render recipes in. When set, the recipes of all requested feedstocks \
+                     are fetched up front and rendered in parallel. By default recipes are rendered in-process",
+    )
+    parser.add_argument(
+        "--render_chunksize",
+        type=int,
+        default=8,
+        help="Number of recipes sent to a render process at once",
+    )
+    parser.add_argument(
+        "--repodata_cache",
+        default=None,
+        help="Directory to keep the indexed repodata of the channels in. \
+                     The index is only rebuilt when the channel's repodata.json changed",
+    )
+    parser.add_argument(
+        "--cache_sizes",
+        type=caches.parse_sizes,
+        default={},
+        help="Memory budget of the in-memory caches in MB, as name=MB,name=MB. There is a cache for each of \
+                     " + ", ".join(cache_budgets),
+    )
+    parser.add_argument(
+        "--cache_stats",
+        action="store_true",
+        help="Print the hits, misses and evictions of every in-memory cache, and the number of recipe requests \
+                     sent and saved, before the build order",
+    )
+    parser.add_argument(
+        "--fast_render",
+        action="store_true",
+        help="Read the requirements of recipes without a full render, by evaluating only their {%% set %%} variables \
+                     and selectors. Recipes it can't handle are rendered in full. Nothing is added to --recipe_store",
+    )
+    parser.add_argument(
+        "--verify_fast_render",
+        action="store_true",
+        help="Instead of resolving dependencies, read every requested recipe (all of them with -m True) both with \
+                     --fast_render and with a full render, and print the ones they disagree on",
+    )
+    parser.add_argument(
+        "--template_cache",
+        default=None,
+        help="Directory to keep compiled recipe templates in, so unchanged recipes are not compiled again",
+    )
+    parser.add_argument(
+        "--template_cache_size",
+        type=int,
+        default=256,
+        help="Size limit of the --template_cache directory in MB",
+    )
     return parser
 
 
-def get_manifest_feedstocks():
-    with open('manifest.yaml') as f:
-        my_list = yaml.safe_load(f)
-
-    return ','.join(my_list['feedstocks'])
-
-
-@cached(cache)
-def get_pinned_packages():
-    with open('conda_build_config.yaml') as f:
-        my_list = yaml.safe_load(f)
-
-    for p in excluded_packages:
-        my_list[p] = ""
-
-    return ','.join(my_list)
-
-
 # Start the program.
 if __name__ == "__main__":
     # Create parser
@@ -526,8 +706,11 @@ if __name__ == "__main__":
     # Get the parsed arguments and get to work!
     args = parser.parse_args()
 
+    template_cache_args = (args.template_cache, args.template_cache_size * 1024 * 1024)
+    configure_template_cache(*template_cache_args)
+
     # Prepare the list of requested archs
-    archs = supported_archs.copy()
+    archs = None
     if args.archs:
         archs = []
         for arch in args.archs.split():
@@ -538,35 +721,72 @@ if __name__ == "__main__":
                       list: {}".format(arch, supported_archs))
                 exit(1)
 
+    try:
+        resolver = Resolver(
+            archs,
+            args.check_version_check_selector,
+            recipe_store=RecipeStore(args.recipe_store) if args.recipe_store else None,
+            outputs_index=OutputsIndex(args.outputs_index) if args.outputs_index else None,
+            http_cache=args.http_cache,
+            repodata_cache=args.repodata_cache,
+            cache_sizes=args.cache_sizes,
+            fast_render=args.fast_render,
+        )
+    except ValueError as e:
+        print(e)
+        exit(1)
+
     if args.manifest.__eq__("True"):
-        to_process = get_manifest_feedstocks().split(",")
+        to_process = list(resolver.manifest_entries())
     else:
         to_process = args.feedstock_name.split(",")
 
-    for feedstock in to_process:
-        if feedstock == "":
-            continue
-        # Remove -feedstock
-        package_name = feedstock[:-10]
-        parent = package_name
-        # Check if the package is accessible in the conda-forge channel
-        repo_avail, def_branch = is_recipe_available(package_name, True)
-        if not repo_avail:
-            print("unable to locate the {} feedstock on conda-forge".format(package_name))
-            continue
-
-        # Inspect and draw package's dependencies
-        deps, version = get_deps(package_name, def_branch)
-
-        print_level(deps, archs, " ", args.check_version_check_selector, args.expand_tree)
-
-    # print_summary(package_name)
-    ordered_feedstocks.pop("wheel-feedstock", "")
-    ordered_feedstocks.pop("setuptools-feedstock", "")
-
-    if args.skip_published.__eq__("True"):
-        for key in get_published():
-            ordered_feedstocks.pop(f"{key}-feedstock", '')
-
-    feedstocks = ','.join(reversed(list(ordered_feedstocks.keys())))
-    print(feedstocks)
+    if args.verify_fast_render:
+        counts, mismatches = resolver.verify_fast_render(to_process)
+        resolver.save()
+        for feedstock, arch, fast, full in mismatches:
+            print(f"{feedstock} ({arch}) differs:\n  fast: {fast!r}\n  full: {full!r}")
+        print("Fast render: " + ", ".join(f"{key}={value}" for key, value in counts.items()))
+        exit(1 if mismatches else 0)
+
+    if args.render_workers > 0:
+        with ProcessPoolExecutor(
+            max_workers=args.render_workers,
+            initializer=configure_template_cache,
+            initargs=template_cache_args,
+        ) as render_executor:
+            resolver.prerender(
+                [feedstock[:-10] for feedstock in to_process if feedstock],
+                "main",
+                max(8, args.render_workers),
+                render_executor,
+                args.render_chunksize,
+            )
+
+    result = resolver.resolve(to_process, args.skip_published.__eq__("True"))
+    resolver.save()
+    if args.output == "json":
+        result["packages"] = {name: resolver.packages[name] for name in result["packages"]}
+        if args.template_cache:
+            result["template_cache"] = template_cache_stats()
+        if args.cache_stats:
+            result["caches"] = resolver.caches.stats()
+            result["requests"] = resolver.fetcher.stats()
+        print(json.dumps(result))
+    else:
+        shown = set()
+        for feedstock in to_process:
+            package_name = feedstock[:-10]
+            if package_name in result["unlocated"]:
+                print("unable to locate the {} feedstock on conda-forge".format(package_name))
+            elif package_name in result["roots"]:
+                # Draw package's dependencies
+                for line in resolver.tree_lines(package_name, args.expand_tree, shown):
+                    print(line)
+        if args.template_cache:
+            print("Template cache: " + ", ".join(f"{key}={value}" for key, value in template_cache_stats().items()))
+        if args.cache_stats:
+            for line in resolver.caches.stats_lines():
+                print(line)
+            print("Recipe requests: " + ", ".join(f"{key}={value}" for key, value in resolver.fetcher.stats().items()))
+        print(','.join(result["order"]))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# Helpers for manifest.yaml.
+# The manifest has a fixed layout (written by abs-cli), one block per feedstock, sorted by name:
+#
+#   feedstocks:
+#     <name>-feedstock:
+#       repo:     conda-forge/<name>-feedstock
+#       branch:   main
+#       commit:   <sha>
+#       ETag:     <etag>
+#
+# which lets us read and edit it line by line instead of round tripping the whole file through yaml.
+# Edits only touch the lines they change, so the rest of the file stays byte for byte the same.
+import argparse
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FIELDS = ("repo", "branch", "commit", "ETag")
+
+_FEEDSTOCK_LINE = re.compile(r"^  (\S[^:]*):\s*$")
+_FIELD_LINE = re.compile(r"^(    (\S+):\s+)(.*?)\s*$")
+# Plain values yaml would read as something other than a string, e.g. a commit made of digits only
+_NON_STRING = re.compile(r"^([-+]?[0-9_.:]+([eE][-+]?[0-9]+)?|0x[0-9a-fA-F_]+|0o?[0-7_]+|\.inf|\.nan|~|null|true|false|yes|no|on|off|y|n|<<|=)?$", re.IGNORECASE)
+
+# Plain values can't start with an indicator, nor contain what would end them early (or a tab, which PyYAML rejects)
+_INDICATORS = "'\"{}[],&*!|>%@`#-?:"
+_SPECIAL = re.compile(r":(\s|$)|\s#|\t")
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return json.loads(value)
+    return value
+
+
+def _quote(value: str) -> str:
+    # Values such as a strong ETag ("abc") would otherwise lose their quotes when read as yaml
+    if value[:1] in _INDICATORS or value != value.strip() or _SPECIAL.search(value) or _NON_STRING.match(value):
+        return "'" + value.replace("'", "''") + "'"
+    return value
+
+
+def _field_line(field: str, value: str) -> str:
+    return f"    {field + ':':<10}{_quote(value)}"
+
+
+def parse_entries(text: str) -> Dict[str, Dict[str, str]]:
+    """Map of feedstock name to its fields"""
+    entries = {}
+    current = None
+    for line in text.split("\n"):
+        if match := _FEEDSTOCK_LINE.match(line):
+            current = entries.setdefault(match.group(1), {})
+        elif current is not None and (match := _FIELD_LINE.match(line)):
+            current[match.group(2)] = _unquote(match.group(3))
+    return entries
+
+
+def read_entries(path: str = "manifest.yaml") -> Dict[str, Dict[str, str]]:
+    """Map of feedstock name to its fields"""
+    with open(path) as f:
+        return parse_entries(f.read())
+
+
+def new_entry(feedstock: str, commit: str, branch: str = "main") -> Dict[str, str]:
+    """Fields of a conda-forge feedstock, like abs aggregate add writes them"""
+    return {"repo": f"conda-forge/{feedstock}", "branch": branch, "commit": commit}
+
+
+def _split_blocks(lines: List[str]) -> Tuple[List[str], List[Tuple[str, List[str]]], List[str]]:
+    # Lines before the first feedstock, the lines of every feedstock and the trailing blank lines
+    header = []
+    blocks = []
+    for line in lines:
+        if match := _FEEDSTOCK_LINE.match(line):
+            blocks.append((match.group(1), [line]))
+        elif blocks:
+            blocks[-1][1].append(line)
+        else:
+            header.append(line)
+    trailer = []
+    if blocks:
+        block_lines = blocks[-1][1]
+        while len(block_lines) > 1 and not block_lines[-1].strip():
+            trailer.insert(0, block_lines.pop())
+    return header, blocks, trailer
+
+
+def _update_block(block_lines: List[str], fields: Dict[str, str]) -> List[str]:
+    pending = dict(fields)
+    result = []
+    for line in block_lines:
+        if (match := _FIELD_LINE.match(line)) and match.group(2) in pending:
+            value = pending.pop(match.group(2))
+            line = match.group(1) + _quote(value)
+        result.append(line)
+    # Fields the entry didn't have yet go after the existing ones
+    result.extend(_field_line(field, value) for field, value in pending.items())
+    return result
+
+
+def apply_changes(path: str = "manifest.yaml",
+                  updates: Optional[Dict[str, Dict[str, str]]] = None,
+                  additions: Optional[Dict[str, Dict[str, str]]] = None,
+                  removals: Iterable[str] = ()):
+    """
+    Apply a batch of changes to the manifest in one pass:
+    updates rewrites (or adds) the given fields of existing feedstocks and ignores unknown ones,
+    additions adds new feedstocks in sorted position (or updates them when they already exist)
+    and removals drops feedstocks.
+    Every line that isn't changed is written back as it was.
+    """
+    updates = dict(updates or {})
+    additions = dict(additions or {})
+    removals = set(removals)
+    with open(path) as f:
+        lines = f.read().split("\n")
+    header, blocks, trailer = _split_blocks(lines)
+
+    existing = {name for name, _ in blocks}
+    for name, fields in additions.items():
+        if name in existing:
+            updates[name] = {**fields, **updates.get(name, {})}
+    new_blocks = sorted(
+        (name, [f"  {name}:"] + [_field_line(field, fields[field]) for field in FIELDS if field in fields]
+         + [_field_line(field, value) for field, value in fields.items() if field not in FIELDS])
+        for name, fields in additions.items() if name not in existing
+    )
+
+    result = list(header)
+    for name, block_lines in blocks:
+        # Keep the file sorted; a manifest that isn't sorted just gets the new feedstocks at the end
+        while new_blocks and new_blocks[0][0] < name:
+            result.extend(new_blocks.pop(0)[1])
+        if name in removals:
+            continue
+        if name in updates:
+            block_lines = _update_block(block_lines, updates[name])
+        result.extend(block_lines)
+    for _, block_lines in new_blocks:
+        result.extend(block_lines)
+    result.extend(trailer)
+
+    with open(path, "w") as f:
+        f.write("\n".join(result))
+
+
+def update_entries(updates: Dict[str, Dict[str, str]], path: str = "manifest.yaml"):
+    """Rewrite the given fields of existing feedstocks, leaving every other line untouched"""
+    apply_changes(path, updates=updates)
+
+
+def diff_entries(old: Dict[str, Dict[str, str]], new: Dict[str, Dict[str, str]]) -> dict:
+    """Feedstocks added, removed and changed between two revisions of the manifest, with the old and new value of every changed field"""
+    changed = {}
+    for name in old.keys() & new.keys():
+        fields = {
+            field: [old[name].get(field), new[name].get(field)]
+            for field in old[name].keys() | new[name].keys()
+            if old[name].get(field) != new[name].get(field)
+        }
+        if fields:
+            changed[name] = dict(sorted(fields.items()))
+    return {
+        "added": {name: new[name] for name in sorted(new.keys() - old.keys())},
+        "removed": {name: old[name] for name in sorted(old.keys() - new.keys())},
+        "changed": dict(sorted(changed.items())),
+    }
+
+
+def read_commits(path: str) -> Dict[str, str]:
+    """'<commit> <feedstock>' lines, as written by git ls-remote | awk, skipping feedstocks without a commit"""
+    commits = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                commits[parts[1]] = parts[0]
+    return commits
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="manifest",
+        description="Edit manifest.yaml in one pass, or compare two revisions of it."
+    )
+    parser.add_argument("-m", "--manifest", default="manifest.yaml", help="Path of the manifest to edit")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    update = subparsers.add_parser("update", help="Set the commit of existing feedstocks")
+    update.add_argument("commits", help="File of '<commit> <feedstock>' lines")
+
+    add = subparsers.add_parser("add", help="Add conda-forge feedstocks, or update them if they already exist")
+    add.add_argument("commits", help="File of '<commit> <feedstock>' lines")
+    add.add_argument("--branch", default="main", help="Branch of the added feedstocks")
+
+    remove = subparsers.add_parser("remove", help="Remove feedstocks")
+    remove.add_argument("feedstocks", help="Comma separated list of feedstocks")
+
+    diff = subparsers.add_parser("diff", help="Print the added, removed and changed feedstocks as json")
+    diff.add_argument("old", help="Old revision of the manifest")
+    diff.add_argument("new", help="New revision of the manifest")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    if args.action == "update":
+        apply_changes(args.manifest, updates={
+            feedstock: {"commit": commit} for feedstock, commit in read_commits(args.commits).items()
+        })
+    elif args.action == "add":
+        apply_changes(args.manifest, additions={
+            feedstock: new_entry(feedstock, commit, args.branch)
+            for feedstock, commit in read_commits(args.commits).items()
+        })
+    elif args.action == "remove":
+        apply_changes(args.manifest, removals=[feedstock for feedstock in args.feedstocks.split(",") if feedstock])
+    else:
+        print(json.dumps(diff_entries(read_entries(args.old), read_entries(args.new)), indent=2))
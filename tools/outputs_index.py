@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Local index of conda-forge/feedstock-outputs.
+# The upstream repo stores one outputs/{a}/{b}/{c}/{package}.json file per package. Instead of fetching those one at a
+# time we build a sqlite table of package -> feedstocks from a local clone or tarball of the repo, and refresh it
+# incrementally by only re-reading the files whose size or modification time changed.
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import tarfile
+from typing import Callable, Dict, Iterator, List, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    package TEXT PRIMARY KEY,
+    feedstocks TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def _package_name(path: str) -> str:
+    return os.path.basename(path)[:-len(".json")]
+
+
+def _is_output_file(path: str) -> bool:
+    # outputs/{a}/{b}/{c}/{package}.json, possibly below a top level directory when coming from a tarball
+    parts = path.replace(os.sep, "/").split("/")
+    return len(parts) >= 5 and parts[-5] == "outputs" and parts[-1].endswith(".json")
+
+
+def _scan_directory(source: str) -> Iterator[Tuple[str, int, int, Callable[[], bytes]]]:
+    for dirpath, _, filenames in os.walk(source):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if not _is_output_file(path):
+                continue
+            stat = os.stat(path)
+
+            def read(path=path):
+                with open(path, "rb") as f:
+                    return f.read()
+
+            yield _package_name(path), int(stat.st_mtime), stat.st_size, read
+
+
+def _scan_tarball(tar: tarfile.TarFile) -> Iterator[Tuple[str, int, int, Callable[[], bytes]]]:
+    for member in tar:
+        if not member.isfile() or not _is_output_file(member.name):
+            continue
+        yield _package_name(member.name), int(member.mtime), member.size, lambda member=member: tar.extractfile(member).read()
+
+
+def _refresh(connection: sqlite3.Connection, entries) -> Tuple[int, int]:
+    known = {package: (mtime, size) for package, mtime, size in connection.execute("SELECT package, mtime, size FROM outputs")}
+    seen = set()
+    updated = 0
+    for package, mtime, size, read in entries:
+        seen.add(package)
+        if known.get(package) == (mtime, size):
+            continue
+        try:
+            feedstocks = json.loads(read())["feedstocks"]
+        except (ValueError, KeyError, TypeError):
+            continue
+        connection.execute(
+            "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+            (package, json.dumps(feedstocks), mtime, size),
+        )
+        updated += 1
+    removed = [(package,) for package in known if package not in seen]
+    connection.executemany("DELETE FROM outputs WHERE package = ?", removed)
+    return updated, len(removed)
+
+
+def build_index(source: str, index_path: str) -> Tuple[int, int]:
+    """
+    Create or refresh the index at index_path from a clone or tarball of feedstock-outputs.
+    Returns the number of packages (re)indexed and removed.
+    """
+    with contextlib.closing(sqlite3.connect(index_path)) as connection, connection:
+        connection.execute(SCHEMA)
+        if os.path.isdir(source):
+            return _refresh(connection, _scan_directory(source))
+        with tarfile.open(source) as tar:
+            return _refresh(connection, _scan_tarball(tar))
+
+
+class OutputsIndex:
+    def __init__(self, index_path: str):
+        # The whole table is small enough to hold in memory, which keeps lookups a dict probe
+        # and means the sqlite connection is never shared between threads.
+        with contextlib.closing(sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)) as connection:
+            self._feedstocks: Dict[str, List[str]] = {
+                package: json.loads(feedstocks)
+                for package, feedstocks in connection.execute("SELECT package, feedstocks FROM outputs")
+            }
+
+    def lookup(self, package: str) -> List[str]:
+        return self._feedstocks.get(package, [])
+
+    def __len__(self):
+        return len(self._feedstocks)
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="outputs_index",
+        description="Build or refresh a local package to feedstock index from a snapshot of conda-forge/feedstock-outputs."
+    )
+    parser.add_argument("source", help="Local clone or tarball of conda-forge/feedstock-outputs")
+    parser.add_argument("index", help="Path of the sqlite index to create or refresh")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    updated, removed = build_index(args.source, args.index)
+    print(f"Indexed {updated} packages, removed {removed}")
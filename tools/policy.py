@@ -0,0 +1,61 @@
+# Which dependencies the crawlers follow.
+# We don't crawl packages pinned in conda_build_config.yaml (we build the pinned version, not the latest), packages
+# we had trouble with, packages blocked in blocklist.yaml and a few build tools. All of them are compiled once into a
+# set of exact names and a single regex of prefixes, so checking a dependency is a hash lookup and one regex match.
+import re
+from typing import Iterable, Optional, Set
+
+import yaml
+
+
+class DependencyPolicy:
+    __slots__ = ("names", "prefixes", "min_length", "_prefix_match")
+
+    def __init__(self, names: Iterable[str] = (), prefixes: Iterable[str] = (), min_length: int = 0):
+        self.names = frozenset(names)
+        self.prefixes = tuple(sorted(set(prefixes)))
+        self.min_length = min_length
+        if self.prefixes:
+            self._prefix_match = re.compile("|".join(map(re.escape, self.prefixes))).match
+        else:
+            self._prefix_match = lambda name: None
+
+    @classmethod
+    def from_files(cls, config_files: Iterable[str], excluded: Iterable[str] = (), blocklist: Optional[str] = None,
+                   names: Iterable[str] = (), prefixes: Iterable[str] = (), min_length: int = 0) -> "DependencyPolicy":
+        """
+        Exclude the packages pinned in the config files, the excluded ones, those blocked as a whole in the
+        blocklist, and the given names and prefixes.
+        """
+        excluded_names = set(names).union(excluded)
+        for path in config_files:
+            excluded_names.update(config_packages(path))
+        if blocklist:
+            excluded_names.update(blocklist_packages(blocklist))
+        return cls(excluded_names, prefixes, min_length)
+
+    def excludes(self, name: str) -> bool:
+        return name in self.names or len(name) < self.min_length or self._prefix_match(name) is not None
+
+    def includes(self, name: str) -> bool:
+        return not self.excludes(name)
+
+
+def config_packages(path: str) -> Set[str]:
+    """Everything pinned in a conda_build_config.yaml"""
+    with open(path) as f:
+        return set(yaml.safe_load(f) or {})
+
+
+def blocklist_packages(path: str) -> Set[str]:
+    """
+    Packages blocked in every version. Entries with a version only block that version, which is up to whoever
+    builds it, so they don't stop us from crawling the package.
+    """
+    with open(path) as f:
+        blocklist = yaml.safe_load(f) or {}
+    return {
+        str(entry["name"])
+        for entry in (blocklist.get("packages") or {}).values()
+        if isinstance(entry, dict) and entry.get("name") and not entry.get("version")
+    }
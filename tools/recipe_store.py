@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# On-disk store of rendered recipes.
+# A rendered recipe only depends on the recipe at a given commit and the configuration used to render it, so
+# entries are keyed by (feedstock, commit, target_platform, pinnings hash) and never need to be invalidated.
+import argparse
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+from typing import Iterable, Optional
+
+
+def pinnings_hash(selector_dict: dict, config_files: Iterable[str] = ()) -> str:
+    """Hash of everything besides the recipe itself that can change the rendered output"""
+    digest = hashlib.sha256(json.dumps(selector_dict, sort_keys=True).encode())
+    for path in config_files:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class RecipeStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, feedstock: str, commit: str, target_platform: str, pinnings: str) -> str:
+        key = hashlib.sha256(f"{feedstock}\0{commit}\0{target_platform}\0{pinnings}".encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, feedstock: str, commit: str, target_platform: str, pinnings: str) -> Optional[dict]:
+        try:
+            with open(self._path(feedstock, commit, target_platform, pinnings)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, feedstock: str, commit: str, target_platform: str, pinnings: str, rendered: dict):
+        path = self._path(feedstock, commit, target_platform, pinnings)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(rendered, f)
+            os.replace(tmp_path, path)
+        except (TypeError, ValueError):
+            # Not everything yaml can produce is valid json; just don't store those
+            os.remove(tmp_path)
+
+    def export(self, archive: str):
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(self.directory, arcname=".")
+
+    @classmethod
+    def restore(cls, archive: str, directory: str) -> "RecipeStore":
+        store = cls(directory)
+        if os.path.exists(archive):
+            with tarfile.open(archive, "r:gz") as tar:
+                # Only extract plain files inside the store
+                members = [
+                    m for m in tar.getmembers()
+                    if (m.isfile() or m.isdir()) and not os.path.isabs(m.name) and ".." not in m.name.split("/")
+                ]
+                tar.extractall(directory, members=members)
+        return store
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="recipe_store",
+        description="Export or restore the rendered recipe store as a single compressed file."
+    )
+    parser.add_argument("action", choices=["export", "restore"])
+    parser.add_argument("archive", help="Path of the .tar.gz archive")
+    parser.add_argument("directory", help="Directory of the recipe store")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    if args.action == "export":
+        RecipeStore(args.directory).export(args.archive)
+    else:
+        RecipeStore.restore(args.archive, args.directory)
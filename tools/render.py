@@ -1,9 +1,21 @@
+import functools
+import glob
+import hashlib
+import os
 import re
+import sys
+import threading
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
 import jinja2
+import jinja2.bccache
 import yaml
-import contextlib
+from cachetools import LRUCache
 # This was copied from https://github.com/anaconda-distribution/percy/blob/main/percy/render/_renderer.py
 
+# A render reads no configuration files: besides the recipe and the selectors, only this module decides its output
+RENDER_SOURCE = os.path.abspath(__file__)
+
 # Pyyaml configuration
 try:
     loader = yaml.CLoader
@@ -11,18 +23,15 @@ except:
     loader = yaml.Loader
 
 
-@contextlib.contextmanager
-def _stringify_numbers():
-    # ensure that numbers are not interpreted as ints or floats.  That trips up versions
-    #     with trailing zeros.
-    implicit_resolver_backup = loader.yaml_implicit_resolvers.copy()
-    for ch in list("0123456789"):
-        if ch in loader.yaml_implicit_resolvers:
-            del loader.yaml_implicit_resolvers[ch]
-    yield
-    for ch in list("0123456789"):
-        if ch in implicit_resolver_backup:
-            loader.yaml_implicit_resolvers[ch] = implicit_resolver_backup[ch]
+class _StringNumberLoader(loader):
+    """
+    Loader that doesn't interpret numbers as ints or floats. That trips up versions with trailing zeros.
+    The resolver table is its own copy, so loading never touches the shared loader classes and is thread safe.
+    """
+
+    yaml_implicit_resolvers = {
+        ch: resolvers for ch, resolvers in loader.yaml_implicit_resolvers.items() if ch not in list("0123456789")
+    }
 
 
 # Jinja configuration
@@ -77,7 +86,189 @@ class _JinjaSilentUndefined(jinja2.Undefined):
     ) = __float__ = __complex__ = __pow__ = __rpow__ = _fail_with_undefined_error
 
 
-_jinja_silent_undef = jinja2.Environment(undefined=_JinjaSilentUndefined)
+class _SizeBoundedBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """Jinja bytecode cache on disk which evicts the least recently used templates once it grows past max_bytes"""
+
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory, "%s.jinja")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        for path in glob.glob(os.path.join(self.directory, "*.jinja")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        with self._lock:
+            if bucket.code is None:
+                self.misses += 1
+                return
+            self.hits += 1
+        try:
+            # Mark as recently used
+            os.utime(self._get_cache_filename(bucket))
+        except OSError:
+            pass
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        # The template may already be on disk, from another process or a thread that compiled it at the same time
+        old_size = self._file_size(filename)
+        super().dump_bytecode(bucket)
+        size = self._file_size(filename)
+        with self._lock:
+            self._size += size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop the oldest entries until we are comfortably below the limit again
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes * 0.8:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+
+# The source of the template being loaded. Templates are looked up by the hash of their source, which the loader can't
+# reverse, so the source is handed over through this (per thread) slot.
+_pending_source = threading.local()
+
+_jinja_silent_undef = jinja2.Environment(
+    undefined=_JinjaSilentUndefined,
+    loader=jinja2.FunctionLoader(lambda name: _pending_source.text),
+    # We keep our own cache of compiled templates below
+    cache_size=0,
+)
+_template_cache = LRUCache(maxsize=1024)
+_template_cache_lock = threading.Lock()
+_template_stats = {"hits": 0, "misses": 0}
+
+
+def configure_template_cache(directory=None, max_bytes=256 * 1024 * 1024, maxsize=1024):
+    """
+    Size the in-memory cache of compiled templates and, with a directory, back it with a bytecode cache on disk so
+    compiled templates survive across runs and processes.
+    """
+    global _template_cache
+    with _template_cache_lock:
+        _template_cache = LRUCache(maxsize=maxsize)
+    _jinja_silent_undef.bytecode_cache = _SizeBoundedBytecodeCache(directory, max_bytes) if directory else None
+
+
+def template_cache_stats() -> dict:
+    """Hit and miss counters of the template caches"""
+    stats = {f"template_{key}": value for key, value in _template_stats.items()}
+    bytecode_cache = _jinja_silent_undef.bytecode_cache
+    if bytecode_cache is not None:
+        stats.update(
+            bytecode_hits=bytecode_cache.hits,
+            bytecode_misses=bytecode_cache.misses,
+            bytecode_evictions=bytecode_cache.evictions,
+        )
+    return stats
+
+
+def _compile_template(meta_yaml_selectors_applied):
+    """Compiled Jinja2 template for a selector-applied recipe, cached by the hash of its source"""
+    key = hashlib.sha256(meta_yaml_selectors_applied.encode()).hexdigest()
+    with _template_cache_lock:
+        template = _template_cache.get(key)
+        _template_stats["hits" if template is not None else "misses"] += 1
+    if template is None:
+        _pending_source.text = meta_yaml_selectors_applied
+        try:
+            template = _jinja_silent_undef.get_template(key)
+        finally:
+            _pending_source.text = None
+        with _template_cache_lock:
+            _template_cache[key] = template
+    return template
+
+
+# A line ending with a selector comment: `<indent><content>  # [<expression>]`
+_selector_line = re.compile(r"(\s*)[^#].*(#\s*\[([^\]]*)\].*)")
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_selector(cond_str: str):
+    # eval() strips leading blanks from source strings, compile() doesn't
+    return compile(cond_str.lstrip(" \t"), "<selector>", "eval")
+
+
+@functools.lru_cache(maxsize=8192)
+def _evaluate_selector(cond_str: str, fingerprint: frozenset):
+    """Evaluate a selector against a selector dict, given as its frozen items. Returns None if evaluation fails."""
+    try:
+        return bool(eval(_compile_selector(cond_str), None, dict(fingerprint)))
+    except Exception:
+        return None
+
+
+def _selector_fingerprint(selector_dict: dict):
+    try:
+        fingerprint = frozenset(selector_dict.items())
+        hash(fingerprint)
+        return fingerprint
+    except TypeError:
+        # Unhashable values, so the result can't be memoized
+        return None
+
+
+def _split_selectors(data: str) -> list:
+    """Split a raw meta yaml into lines, pairing each with its selector match (or None)"""
+    return [
+        (line, _selector_line.search(line) if "[" in line and "#" in line else None)
+        for line in data.splitlines()
+    ]
+
+
+def _apply_split_selector(lines: list, selector_dict: dict) -> str:
+    fingerprint = _selector_fingerprint(selector_dict)
+    updated_data = []
+    for line, match in lines:
+        if match is not None:
+            cond_str = match.group(3)
+            if fingerprint is not None:
+                selected = _evaluate_selector(cond_str, fingerprint)
+            else:
+                try:
+                    selected = bool(eval(_compile_selector(cond_str), None, selector_dict))
+                except Exception:
+                    selected = None
+            if selected is None:
+                continue
+            if not selected:
+                line = f"{match.group(1)}"
+            else:
+                line = line.replace(
+                    match.group(2), ""
+                )  # <-- comments sometimes causes trouble in jinja
+        updated_data.append(line)
+    return "\n".join(updated_data)
 
 
 def _apply_selector(data: str, selector_dict: dict) -> list[str]:
@@ -90,21 +281,7 @@ def _apply_selector(data: str, selector_dict: dict) -> list[str]:
     Returns:
         list[str]: meta yaml filtered based on selectors, as a list of string.
     """
-    updated_data = []
-    for line in data.splitlines():
-        if (match := re.search(r"(\s*)[^#].*(#\s*\[([^\]]*)\].*)", line)) is not None:
-            cond_str = match.group(3)
-            try:
-                if not eval(cond_str, None, selector_dict):
-                    line = f"{match.group(1)}"
-                else:
-                    line = line.replace(
-                        match.group(2), ""
-                    )  # <-- comments sometimes causes trouble in jinja
-            except Exception:
-                continue
-        updated_data.append(line)
-    return "\n".join(updated_data)
+    return _apply_split_selector(_split_selectors(data), selector_dict)
 
 
 def _get_template(meta_yaml, selector_dict):
@@ -113,10 +290,10 @@ def _get_template(meta_yaml, selector_dict):
     # Storing it means the recipe cannot be pickled, which in turn
     # means we cannot pass it to ProcessExecutors.
     meta_yaml_selectors_applied = _apply_selector(meta_yaml, selector_dict)
-    return _jinja_silent_undef.from_string(meta_yaml_selectors_applied)
+    return _compile_template(meta_yaml_selectors_applied)
 
 
-def render(meta_yaml, selector_dict):
+def _jinja_vars(selector_dict):
     #: Variables to pass to Jinja when rendering recipe
     def expand_compiler(lang):
         compiler = selector_dict.get(f"{lang}_compiler", None)
@@ -125,7 +302,7 @@ def render(meta_yaml, selector_dict):
         else:
             return f"{compiler}_{selector_dict.get('target_platform', 'linux-64')}"
 
-    JINJA_VARS = {
+    return {
         "unix": selector_dict.get("unix", False),
         "win": selector_dict.get("win", False),
         "PYTHON": selector_dict.get(
@@ -157,10 +334,417 @@ def render(meta_yaml, selector_dict):
         "os.environ.get": lambda name, default="": "",
         "ccache": lambda name, method="": "ccache",
     }
-    yaml_text = _get_template(meta_yaml, selector_dict).render(JINJA_VARS)
 
-    with _stringify_numbers():
-        return yaml.load(
-            yaml_text.replace("\t", " ").replace("%", " "), Loader=loader
+
+def _load_yaml(yaml_text):
+    return yaml.load(
+        yaml_text.replace("\t", " ").replace("%", " "), Loader=_StringNumberLoader
+    )
+
+
+def platform_selectors(target_platform: str) -> dict:
+    """Selector dict for a conda subdir, e.g. linux-64 or osx-arm64"""
+    platform, _, arch = target_platform.partition("-")
+    return {
+        "target_platform": target_platform,
+        "linux": platform == "linux",
+        "osx": platform == "osx",
+        "win": platform == "win",
+        "unix": platform in ("linux", "osx"),
+        "x86": arch in ("32", "64"),
+        "x86_64": arch == "64",
+        "arm64": arch == "arm64",
+        "aarch64": arch == "aarch64",
+        "ppc64le": arch == "ppc64le",
+        "s390x": arch == "s390x",
+        "linux64": target_platform == "linux-64",
+        "linux32": target_platform == "linux-32",
+        "osx64": target_platform == "osx-64",
+        "win64": target_platform == "win-64",
+        "win32": target_platform == "win-32",
+    }
+
+
+class OutputDeps(NamedTuple):
+    """Requirements of a recipe or of one of its outputs"""
+
+    name: str
+    build: Tuple[str, ...] = ()
+    host: Tuple[str, ...] = ()
+    run: Tuple[str, ...] = ()
+
+
+def _output_deps(name, requirements) -> OutputDeps:
+    if not isinstance(requirements, dict):
+        return OutputDeps(_intern(name))
+    return OutputDeps(
+        _intern(name),
+        *(_requirement_list(requirements.get(section)) for section in ("build", "host", "run")),
+    )
+
+
+def _requirement_list(requirements) -> Tuple[str, ...]:
+    if not isinstance(requirements, list):
+        return ()
+    return tuple(_intern(dep) for dep in requirements if isinstance(dep, str) and dep.strip())
+
+
+def _intern(name) -> str:
+    # The same few thousand packages are required all over, so every recipe shares a single copy of each string
+    return sys.intern(str(name)) if name is not None else ""
+
+
+class RecipeDeps(NamedTuple):
+    """
+    What the crawlers read from a rendered recipe: the package version and the build/host/run requirements of the
+    recipe and of each of its outputs. A fraction of the size of the rendered recipe, and cheap to pickle.
+    """
+
+    version: Optional[str]
+    recipe: OutputDeps
+    outputs: Tuple[OutputDeps, ...] = ()
+
+    @classmethod
+    def from_rendered(cls, rendered) -> Optional["RecipeDeps"]:
+        """Extract the requirements of a rendered recipe, None if it didn't render to a recipe at all"""
+        if not isinstance(rendered, dict):
+            return None
+        package = rendered.get("package")
+        package = package if isinstance(package, dict) else {}
+        outputs = rendered.get("outputs")
+        return cls(
+            package.get("version"),
+            _output_deps(package.get("name"), rendered.get("requirements")),
+            tuple(
+                _output_deps(output.get("name"), output.get("requirements"))
+                for output in (outputs if isinstance(outputs, list) else ())
+                if isinstance(output, dict)
+            ),
         )
 
+    def requirements(self, output: Optional[str] = None) -> Iterator[str]:
+        """
+        The build, then run, then host requirements of the recipe and its outputs, or only those of the recipe and
+        the named output.
+        """
+        outputs = [o for o in self.outputs if output is None or o.name == output]
+        for section in ("build", "run", "host"):
+            yield from getattr(self.recipe, section)
+            for o in outputs:
+                yield from getattr(o, section)
+
+    def output_names(self) -> Tuple[str, ...]:
+        return tuple(o.name for o in self.outputs)
+
+
+def recipe_deps(renders: Dict[str, dict]) -> Dict[str, Optional[RecipeDeps]]:
+    """The RecipeDeps of the render of every platform"""
+    return {platform: RecipeDeps.from_rendered(rendered) for platform, rendered in renders.items()}
+
+
+# The fast path reads the requirements of a recipe without rendering it. Most recipes only use `{% set %}` variables,
+# `{{ }}` expressions and selectors, so the expressions are evaluated one by one on the selector-applied lines and the
+# package, requirements and outputs sections are read line by line. Anything else (other Jinja statements, whitespace
+# control, flow collections, anchors, multi-line scalars, ...) makes it give up and leave the recipe to the full render.
+class _Unsupported(Exception):
+    pass
+
+
+# A line with a `{% set name = expression %}`, even in a yaml comment; Jinja runs it either way
+_set_line = re.compile(r"(.*?){%\s*set\s+([A-Za-z_]\w*)\s*=\s*(.*?)\s*%}(.*)")
+_empty_flow = re.compile(r"(\[\s*\]|{\s*})(\s+#.*)?")
+_expression = re.compile(r"{{(.*?)}}")
+_variable = re.compile(r"\s*([A-Za-z_]\w*)\s*")
+# A `key:` or `key: value` line of a block mapping
+_key_line = re.compile(r"([^\s'\"#&*!|>%@`\[\]{},?:-][^:#]*?)\s*:(?:\s+(.*))?")
+_comment = re.compile(r"\s+#")
+_SCALAR = "scalar"
+# What the fast path reads: mappings list the keys read (others are skipped), lists are sequences of their only item
+_REQUIREMENTS_SCHEMA = {"build": [_SCALAR], "host": [_SCALAR], "run": [_SCALAR]}
+_RECIPE_SCHEMA = {
+    "package": {"name": _SCALAR, "version": _SCALAR},
+    "requirements": _REQUIREMENTS_SCHEMA,
+    "outputs": [{"name": _SCALAR, "requirements": _REQUIREMENTS_SCHEMA}],
+}
+
+
+@functools.lru_cache(maxsize=8192)
+def _compile_expression(source: str):
+    return _jinja_silent_undef.compile_expression(source, undefined_to_none=False)
+
+
+def _evaluate(source: str, context: dict):
+    if source.startswith("-") or source.endswith("-"):
+        # Whitespace control, which can join lines
+        raise _Unsupported(source)
+    variable = _variable.fullmatch(source)
+    if variable is not None and variable.group(1) in context:
+        # Most expressions are just a variable, which doesn't need compiling
+        return context[variable.group(1)]
+    try:
+        return _compile_expression(source.strip())(context)
+    except Exception as e:
+        raise _Unsupported(source) from e
+
+
+def _expand(text: str, context: dict) -> list:
+    """The lines of the selector-applied recipe as Jinja would render them, as (indent, content) without comments"""
+    lines = []
+    for line in text.split("\n"):
+        if "{#" in line:
+            raise _Unsupported(line)
+        if "{%" in line:
+            match = _set_line.fullmatch(line)
+            if match is None or "{" in match.group(1) + match.group(4):
+                raise _Unsupported(line)
+            context[match.group(2)] = _evaluate(match.group(3), context)
+            line = match.group(1) + match.group(4)
+        if "{{" in line:
+            parts = _expression.split(line)
+            if any("{{" in part for part in parts[::2]):
+                raise _Unsupported(line)
+            for i in range(1, len(parts), 2):
+                parts[i] = str(_evaluate(parts[i], context))
+                if "\n" in parts[i]:
+                    raise _Unsupported(line)
+            line = "".join(parts)
+        # Like _load_yaml
+        line = line.replace("\t", " ").replace("%", " ")
+        content = line.strip()
+        if content and not content.startswith("#"):
+            lines.append((len(line) - len(line.lstrip(" ")), content))
+    return lines
+
+
+def _is_item(content: str) -> bool:
+    return content == "-" or content.startswith("- ")
+
+
+def _scalar(text: str):
+    """A scalar on a single line, as the yaml loader would read it. Only strings and null are supported."""
+    if not text or text.startswith("#"):
+        return None
+    if text[0] in "'\"":
+        quote = text[0]
+        end = 1
+        while True:
+            end = text.find(quote, end)
+            if end == -1:
+                raise _Unsupported(text)
+            if quote == "'" and text.startswith("''", end):
+                end += 2
+                continue
+            break
+        value = text[1:end]
+        if quote == '"' and "\\" in value:
+            raise _Unsupported(text)
+        rest = text[end + 1:]
+        if rest.strip() and not _comment.match(rest):
+            raise _Unsupported(text)
+        return value.replace("''", "'") if quote == "'" else value
+    if text[0] in "[]{}&*!|>%@`,?:" or _is_item(text):
+        raise _Unsupported(text)
+    comment = _comment.search(text)
+    value = (text[:comment.start()] if comment else text).rstrip()
+    if ": " in value or value.endswith(":"):
+        raise _Unsupported(text)
+    resolvers = _StringNumberLoader.yaml_implicit_resolvers
+    for tag, regexp in resolvers.get(value[0], []) + resolvers.get(None, []):
+        if regexp.match(value):
+            if tag == "tag:yaml.org,2002:null":
+                return None
+            raise _Unsupported(text)
+    return value
+
+
+class _BlockParser:
+    """Reads what a schema asks for from the (indent, content) lines of a yaml document of block collections"""
+
+    def __init__(self, lines: list):
+        self.lines = lines
+        self.pos = 0
+
+    def peek(self):
+        return self.lines[self.pos] if self.pos < len(self.lines) else (-1, "")
+
+    def document(self, schema):
+        if not self.lines:
+            return None
+        if self.lines[0][0] != 0:
+            raise _Unsupported("indented document")
+        return self.mapping(0, schema)
+
+    def node(self, schema):
+        indent, content = self.peek()
+        if _is_item(content):
+            if not isinstance(schema, list):
+                raise _Unsupported(content)
+            return self.sequence(indent, schema[0])
+        if not isinstance(schema, dict):
+            raise _Unsupported(content)
+        return self.mapping(indent, schema)
+
+    def skip(self, indent):
+        # Everything below a key we don't read, including a sequence at the key's own indent
+        while self.peek()[0] > indent or (self.peek()[0] == indent and _is_item(self.peek()[1])):
+            self.pos += 1
+
+    def mapping(self, indent, schema, first=None):
+        result = {}
+        while True:
+            if first is not None:
+                # The first key of a mapping inside a sequence is on the line of the item
+                content, first = first, None
+            else:
+                line_indent, content = self.peek()
+                if line_indent < indent:
+                    return result
+                if line_indent > indent or _is_item(content):
+                    raise _Unsupported(content)
+                self.pos += 1
+            match = _key_line.fullmatch(content)
+            if match is None:
+                raise _Unsupported(content)
+            key, inline = match.groups()
+            if key not in schema:
+                self.skip(indent)
+                continue
+            line_indent, next_content = self.peek()
+            nested = line_indent > indent or (line_indent == indent and _is_item(next_content))
+            if inline and _empty_flow.fullmatch(inline) and schema[key] is not _SCALAR:
+                if nested:
+                    raise _Unsupported(content)
+                value = [] if inline.startswith("[") else {}
+            elif inline and not inline.startswith("#"):
+                value = _scalar(inline)
+                if nested or (value is not None and schema[key] is not _SCALAR):
+                    raise _Unsupported(content)
+            elif nested:
+                if schema[key] is _SCALAR:
+                    raise _Unsupported(content)
+                value = self.node(schema[key])
+            else:
+                value = None
+            result[key] = value
+
+    def sequence(self, indent, schema):
+        result = []
+        while True:
+            line_indent, content = self.peek()
+            if line_indent < indent or (line_indent == indent and not _is_item(content)):
+                return result
+            if line_indent > indent:
+                raise _Unsupported(content)
+            self.pos += 1
+            inline = content[1:].lstrip(" ")
+            if not inline or inline.startswith("#"):
+                nested = self.peek()[0] > indent
+                if nested and schema is _SCALAR:
+                    raise _Unsupported(content)
+                result.append(self.node(schema) if nested else None)
+            elif schema is _SCALAR:
+                if self.peek()[0] > indent:
+                    raise _Unsupported(content)
+                result.append(_scalar(inline))
+            elif isinstance(schema, dict):
+                result.append(self.mapping(indent + len(content) - len(inline), schema, first=inline))
+            else:
+                raise _Unsupported(content)
+
+
+def _fast_recipe_deps(meta_yaml_selectors_applied: str, selector_dict: dict) -> Optional[RecipeDeps]:
+    lines = _expand(meta_yaml_selectors_applied, _jinja_vars(selector_dict))
+    return RecipeDeps.from_rendered(_BlockParser(lines).document(_RECIPE_SCHEMA))
+
+
+def _full_recipe_deps(meta_yaml_selectors_applied: str, selector_dict: dict) -> Optional[RecipeDeps]:
+    template = _compile_template(meta_yaml_selectors_applied)
+    return RecipeDeps.from_rendered(_load_yaml(template.render(_jinja_vars(selector_dict))))
+
+
+def render_deps_multi(meta_yaml, selector_dicts) -> list:
+    """
+    The RecipeDeps of a recipe for every selector dict, read with the fast path, or from the full render for
+    platforms it can't handle.
+    """
+    lines = _split_selectors(meta_yaml)
+    deps = []
+    for selector_dict in selector_dicts:
+        meta_yaml_selectors_applied = _apply_split_selector(lines, selector_dict)
+        try:
+            deps.append(_fast_recipe_deps(meta_yaml_selectors_applied, selector_dict))
+        except _Unsupported:
+            deps.append(_full_recipe_deps(meta_yaml_selectors_applied, selector_dict))
+    return deps
+
+
+def verify_fast_render(meta_yaml, selector_dicts) -> list:
+    """
+    Read a recipe with both the fast path and the full render, for every selector dict. Returns (status, fast, full)
+    for each of them, where status is "fast" if both agree, "fallback" if the fast path left the recipe to the full
+    render and "mismatch" otherwise. full is the exception if the full render failed.
+    """
+    lines = _split_selectors(meta_yaml)
+    report = []
+    for selector_dict in selector_dicts:
+        meta_yaml_selectors_applied = _apply_split_selector(lines, selector_dict)
+        try:
+            full = _full_recipe_deps(meta_yaml_selectors_applied, selector_dict)
+        except Exception as e:
+            full = e
+        try:
+            fast = _fast_recipe_deps(meta_yaml_selectors_applied, selector_dict)
+        except _Unsupported:
+            report.append(("fallback", None, full))
+            continue
+        report.append(("fast" if fast == full else "mismatch", fast, full))
+    return report
+
+
+def render_multi(meta_yaml, selector_dicts):
+    """
+    Render a recipe once for every selector dict.
+    The recipe is split into lines and selectors only once, and platforms whose selectors leave the same
+    text share a single compiled template.
+    """
+    lines = _split_selectors(meta_yaml)
+    rendered = []
+    for selector_dict in selector_dicts:
+        template = _compile_template(_apply_split_selector(lines, selector_dict))
+        rendered.append(_load_yaml(template.render(_jinja_vars(selector_dict))))
+    return rendered
+
+
+def render(meta_yaml, selector_dict):
+    yaml_text = _get_template(meta_yaml, selector_dict).render(_jinja_vars(selector_dict))
+    return _load_yaml(yaml_text)
+
+
+def _render_task(task):
+    meta_yaml, selector_dicts = task
+    try:
+        return render_multi(meta_yaml, selector_dicts)
+    except Exception:
+        return None
+
+
+def _render_deps_task(task):
+    meta_yaml, selector_dicts = task
+    try:
+        return render_deps_multi(meta_yaml, selector_dicts)
+    except Exception:
+        return None
+
+
+def render_many(tasks, executor=None, chunksize=1, deps_only=False):
+    """
+    Render many recipes, each given as a (meta_yaml, selector_dicts) pair, with render_multi, or with
+    render_deps_multi if only their RecipeDeps are needed. A recipe that fails to render gives None instead of
+    failing the whole batch.
+    Passing a ProcessPoolExecutor spreads the (CPU bound) rendering over several cores. Only the raw text and the
+    resulting plain dicts cross the process boundary, in chunks of chunksize tasks to amortize the IPC.
+    """
+    task = _render_deps_task if deps_only else _render_task
+    if executor is None:
+        return [task(t) for t in tasks]
+    return list(executor.map(task, tasks, chunksize=chunksize))
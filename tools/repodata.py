@@ -0,0 +1,209 @@
+# Index of a channel subdir's repodata.json by package name.
+# repodata.json has one record per package file, under both "packages" (.tar.bz2) and "packages.conda". We only ever
+# ask which versions of a package exist, so the records are reduced to (version, build, file name) and grouped by name.
+# The repodata is decoded one record at a time while it downloads, so neither the whole file nor the whole parsed
+# document is ever held in memory, only the index.
+# The index is kept on disk with the ETag/Last-Modified of the repodata it was built from, and rebuilt only when the
+# server says the repodata changed.
+import codecs
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+
+from versions import Key, sorted_keys
+
+Record = Tuple[str, str, str]
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+# Bytes of repodata read at a time; a record is well under that
+_CHUNK_SIZE = 1 << 20
+
+
+class _StreamReader:
+    """Decodes a JSON document from an iterable of byte chunks, keeping only the text not consumed yet"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._pos = 0
+        self._done = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk, False once there is nothing left to append"""
+        if self._done:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._done = True
+            text = self._utf8.decode(b"", final=True)
+        else:
+            text = self._utf8.decode(chunk)
+        self._text = self._text[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next character that isn't whitespace, "" at the end of the document"""
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Malformed repodata, expected {char!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        """Decode the next value as a whole"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                # Most likely cut off at the end of the chunk
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the chunk may go on in the next one
+            if end == len(self._text) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object that comes next; the value of each must be read before asking for the next key"""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("Malformed repodata, expected ',' or '}'")
+
+
+def file_chunks(path: str) -> Iterator[bytes]:
+    """The content of a file, read a chunk at a time"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_records(chunks: Iterable[bytes]) -> Iterator[Tuple[str, dict]]:
+    """(file name, record) of every package file in the repodata.json given as byte chunks, as they are decoded"""
+    reader = _StreamReader(chunks)
+    for key in reader.members():
+        if key in ("packages", "packages.conda"):
+            for filename in reader.members():
+                yield filename, reader.value()
+        else:
+            reader.value()
+
+
+class RepodataIndex:
+    def __init__(self, records: Dict[str, List[Record]]):
+        self._records = records
+        self._version_keys: Dict[str, List[Key]] = {}
+
+    @classmethod
+    def from_records(cls, package_records: Iterable[Tuple[str, dict]]) -> "RepodataIndex":
+        records: Dict[str, List[Record]] = {}
+        for filename, record in package_records:
+            records.setdefault(record["name"], []).append((record["version"], record.get("build", ""), filename))
+        return cls(records)
+
+    @classmethod
+    def from_json(cls, records: Dict[str, List[list]]) -> "RepodataIndex":
+        return cls({name: [tuple(record) for record in name_records] for name, name_records in records.items()})
+
+    def to_json(self) -> Dict[str, List[Record]]:
+        return self._records
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def names(self) -> Iterable[str]:
+        return self._records.keys()
+
+    def records(self, name: str) -> List[Record]:
+        return self._records.get(name, [])
+
+    def versions(self, name: str) -> List[str]:
+        return [version for version, _, _ in self.records(name)]
+
+    def version_keys(self, name: str) -> List[Key]:
+        """Sorted version keys of the package, parsed on first use"""
+        keys = self._version_keys.get(name)
+        if keys is None:
+            keys = self._version_keys[name] = sorted_keys(self.versions(name))
+        return keys
+
+
+def _cache_path(cache_dir: str, url: str) -> str:
+    return os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+
+def load_index(channel_url: str, subdir: str, cache_dir: Optional[str] = None,
+               session: Optional[requests.Session] = None) -> RepodataIndex:
+    """
+    Index of the repodata of channel_url/subdir. With a cache_dir, the index is stored there and revalidated with
+    If-None-Match/If-Modified-Since on the next call. An empty index is returned if the repodata can't be fetched.
+    """
+    url = f"{channel_url.rstrip('/')}/{subdir}/repodata.json"
+    session = session or requests.Session()
+    cached = None
+    headers = {}
+    if cache_dir:
+        try:
+            with open(_cache_path(cache_dir, url)) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+    with session.get(url, headers=headers, stream=True) as response:
+        if response.status_code != 200:
+            if response.status_code != 304:
+                print(f"Could not get repodata at {url}")
+                print(f"Error [{response.status_code}]: {response.reason}")
+            # A stale index is still better than none
+            return RepodataIndex.from_json(cached["records"]) if cached else RepodataIndex({})
+        index = RepodataIndex.from_records(iter_records(response.iter_content(chunk_size=_CHUNK_SIZE)))
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "records": index.to_json(),
+            }, f)
+        os.replace(tmp_path, _cache_path(cache_dir, url))
+    return index
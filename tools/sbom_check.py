@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# Check that every package in a channel's repodata.json has an SBOM.
+# The channel's sboms/index.json lists one <name>-<version>-<build>.<ext>.spdx.json path per SBOM, so the SBOMs are
+# indexed by the package file name they describe and every package is a single lookup.
+# The repodata is stream-parsed, so only the package file names are held in memory.
+import argparse
+import json
+import posixpath
+from typing import Dict, Iterable, List, Set
+
+from repodata import file_chunks, iter_records
+
+SBOM_SUFFIX = ".spdx.json"
+
+
+def read_json(path: str) -> dict:
+    with open(path, "rb") as f:
+        return json.load(f)
+
+
+def repodata_packages(path: str) -> List[str]:
+    """File names of all the packages in the repodata.json at path, both .tar.bz2 and .conda"""
+    return [filename for filename, _ in iter_records(file_chunks(path))]
+
+
+def sbom_package(path: str) -> str:
+    """File name of the package an SBOM path is for"""
+    name = posixpath.basename(path)
+    return name[:-len(SBOM_SUFFIX)] if name.endswith(SBOM_SUFFIX) else name
+
+
+def index_sboms(paths: Iterable[str]) -> Set[str]:
+    return {sbom_package(path) for path in paths}
+
+
+def match_packages(packages: List[str], sbom_index: dict) -> Dict[str, object]:
+    """The packages without an SBOM, with the counts reported to metrics"""
+    paths = sbom_index.get("paths", {})
+    sboms = index_sboms(paths)
+    not_found = [package for package in packages if package not in sboms]
+    return {
+        "repodata_packages_count": len(packages),
+        "sbom_index_paths_count": len(paths),
+        "not_found_packages": not_found,
+        "not_found_packages_count": len(not_found),
+    }
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sbom_check",
+        description="Print the packages of a channel that don't have an SBOM as json."
+    )
+    parser.add_argument("repodata", help="Path of the channel's repodata.json")
+    parser.add_argument("index", help="Path of the channel's sboms/index.json")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    print(json.dumps(match_packages(repodata_packages(args.repodata), read_json(args.index)), indent=2))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# Check that the SBOMs listed in a channel's sboms/index.json are what the index says they are.
+# Every SBOM document is fetched and its top level "name" compared with its index path. Documents are fetched on a
+# bounded pool and only read up to the "name" field. The ETag/Last-Modified of every document, or its hash from the
+# index, is kept in a state file so documents that didn't change are not checked again on the next run.
+import argparse
+import codecs
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from sbom_check import read_json
+
+
+class _NameScanner:
+    """Finds the value of the top level "name" key of a json document fed to it in pieces"""
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        # The last string closed at the top level, which is a key if a colon follows
+        self.candidate = None
+        # Where the value of "name" starts once we've seen the key
+        self.value_start = None
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, chunk: str) -> Tuple[bool, Optional[str]]:
+        """Returns (True, name) once the name is known, name being None if it isn't a string"""
+        self.text += chunk
+        text = self.text
+        if self.value_start is not None:
+            return self._value()
+        while self.pos < len(text):
+            c = text[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.candidate = text[self.string_start:self.pos + 1]
+            elif c == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif not c.isspace():
+                if c == ":" and self.depth == 1 and self.candidate is not None and json.loads(self.candidate) == "name":
+                    self.value_start = self.pos + 1
+                    self.pos += 1
+                    return self._value()
+                self.candidate = None
+                if c in "{[":
+                    self.depth += 1
+                elif c in "}]":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        # End of the document without a name
+                        return True, None
+            self.pos += 1
+        return False, None
+
+    def _value(self) -> Tuple[bool, Optional[str]]:
+        start = self.value_start
+        while start < len(self.text) and self.text[start].isspace():
+            start += 1
+        try:
+            value, _ = self.decoder.raw_decode(self.text, start)
+        except ValueError:
+            # Not all of the value is here yet
+            return False, None
+        return True, value if isinstance(value, str) else None
+
+
+class SbomValidator:
+    def __init__(self, base_url: str, workers: int = 16, timeout: float = 30, state: Optional[dict] = None):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        #: Validators and the name found for every path, from earlier runs
+        self.state: Dict[str, dict] = state if state is not None else {}
+        self._lock = threading.Lock()
+
+    def _read_name(self, response: requests.Response) -> Tuple[Optional[str], int]:
+        scanner = _NameScanner()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        size = 0
+        for chunk in response.iter_content(chunk_size=16 * 1024):
+            size += len(chunk)
+            found, name = scanner.feed(decoder.decode(chunk))
+            if found:
+                return name, size
+        return None, size
+
+    def check(self, path: str, digest: Optional[str] = None) -> dict:
+        """Name of the SBOM at path, and how it was obtained"""
+        with self._lock:
+            previous = self.state.get(path, {})
+        if digest and previous.get("digest") == digest and "name" in previous:
+            return {"name": previous["name"], "status": "unchanged", "seconds": 0.0, "bytes": 0}
+
+        headers = {}
+        if "name" in previous:
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                headers["If-Modified-Since"] = previous["last_modified"]
+        start = time.perf_counter()
+        try:
+            with self.session.get(self.base_url + path, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    return {"name": previous["name"], "status": "not_modified", "seconds": time.perf_counter() - start, "bytes": 0}
+                if response.status_code != 200:
+                    return {"error": f"[{response.status_code}]: {response.reason}", "status": "error", "seconds": time.perf_counter() - start, "bytes": 0}
+                name, size = self._read_name(response)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except requests.RequestException as e:
+            # Don't print the url, it has the channel token in it
+            return {"error": type(e).__name__, "status": "error", "seconds": time.perf_counter() - start, "bytes": 0}
+
+        with self._lock:
+            self.state[path] = {"name": name, "etag": etag, "last_modified": last_modified, "digest": digest}
+        return {"name": name, "status": "fetched", "seconds": time.perf_counter() - start, "bytes": size}
+
+    def validate(self, paths: Dict[str, Optional[str]]) -> dict:
+        """Check the SBOMs at the given paths (with their hash from the index, if any) against their index path"""
+        start = time.perf_counter()
+        ordered = sorted(paths)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda path: self.check(path, paths[path]), ordered))
+
+        mismatches = {}
+        errors = {}
+        for path, result in zip(ordered, results):
+            if result["status"] == "error":
+                errors[path] = result["error"]
+            elif result["name"] != path:
+                mismatches[path] = result["name"]
+
+        seconds = [result["seconds"] for result in results if result["status"] in ("fetched", "not_modified")]
+        stats = {
+            status: sum(result["status"] == status for result in results)
+            for status in ("fetched", "not_modified", "unchanged", "error")
+        }
+        stats.update(
+            paths=len(results),
+            bytes=sum(result["bytes"] for result in results),
+            seconds=round(time.perf_counter() - start, 3),
+            request_seconds_median=round(statistics.median(seconds), 4) if seconds else 0,
+            request_seconds_max=round(max(seconds), 4) if seconds else 0,
+        )
+        return {"mismatches": mismatches, "errors": errors, "stats": stats}
+
+
+def index_paths(sbom_index: dict) -> Dict[str, Optional[str]]:
+    """Paths in the index with the hash of the document, when the index has one"""
+    paths = {}
+    for path, info in sbom_index.get("paths", {}).items():
+        digest = None
+        if isinstance(info, dict):
+            digest = info.get("sha256") or info.get("md5")
+        paths[path] = digest
+    return paths
+
+
+def load_state(path: Optional[str]) -> dict:
+    if not path:
+        return {}
+    try:
+        return read_json(path)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict, path: str, keep: Iterable[str]):
+    # Forget about SBOMs that are no longer in the index
+    keep = set(keep)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({key: value for key, value in state.items() if key in keep}, f)
+    os.replace(tmp_path, path)
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sbom_validate",
+        description="Check the name of every SBOM in a channel's sboms/index.json against its path and print the "
+                    "mismatches as json."
+    )
+    parser.add_argument("index", help="Path of the channel's sboms/index.json")
+    parser.add_argument("base_url", help="Url of the channel's sboms directory")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="Number of SBOMs to fetch concurrently")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for the server")
+    parser.add_argument("--state", default=None,
+                        help="File to keep the ETags of checked SBOMs in, so unchanged SBOMs are skipped next time")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    paths = index_paths(read_json(args.index))
+    validator = SbomValidator(args.base_url, args.workers, args.timeout, load_state(args.state))
+    result = validator.validate(paths)
+    if args.state:
+        save_state(validator.state, args.state, paths)
+    print(json.dumps(result, indent=2))
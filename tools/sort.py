@@ -1,83 +1,178 @@
-from typing import Iterable, Tuple, Set, Dict, Union
-
-from pydantic import BaseModel
-
-
-class EquivalenceClass(BaseModel):
-    members: Set[str]
-    cycle_edges: Dict[str, Set[str]]
+import heapq
+from typing import Iterable, Iterator, List, Optional, Set, Dict
+
+
+class EquivalenceClass:
+    __slots__ = ("members", "cycle_edges")
+
+    def __init__(self, members: Set[str], cycle_edges: Dict[str, Set[str]]):
+        self.members = members
+        # Edges between the members when they form a cycle, empty otherwise
+        self.cycle_edges = cycle_edges
+
+    def __repr__(self):
+        return f"EquivalenceClass(members={self.members!r}, cycle_edges={self.cycle_edges!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, EquivalenceClass):
+            return NotImplemented
+        return self.members == other.members and self.cycle_edges == other.cycle_edges
+
+
+def _strongly_connected_components(nodes: List[str], depends_on: List[List[int]]) -> List[int]:
+    """Component number of each node (Tarjan's algorithm, iterative so deep chains don't hit the recursion limit)"""
+    index = [-1] * len(nodes)
+    lowlink = [0] * len(nodes)
+    component = [-1] * len(nodes)
+    on_stack = [False] * len(nodes)
+    stack = []
+    counter = 0
+    components = 0
+    for root in range(len(nodes)):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, edge = work.pop()
+            if edge == 0:
+                index[node] = lowlink[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            elif edge <= len(depends_on[node]):
+                # Returning from the dependency we descended into
+                lowlink[node] = min(lowlink[node], lowlink[depends_on[node][edge - 1]])
+            while edge < len(depends_on[node]):
+                dependency = depends_on[node][edge]
+                edge += 1
+                if index[dependency] == -1:
+                    work.append((node, edge))
+                    work.append((dependency, 0))
+                    break
+                if on_stack[dependency]:
+                    lowlink[node] = min(lowlink[node], index[dependency])
+            else:
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = components
+                        if member == node:
+                            break
+                    components += 1
+    return component
+
+
+def reachable(edge_map: Dict[str, Set[str]], roots: Iterable[str]) -> Dict[str, Set[str]]:
+    """Restrict the edge map to the nodes reachable from the roots"""
+    result = {}
+    to_visit = [root for root in roots if root in edge_map]
+    while to_visit:
+        node = to_visit.pop()
+        if node in result:
+            continue
+        result[node] = edge_map[node]
+        to_visit.extend(dest for dest in edge_map[node] if dest in edge_map and dest not in result)
+    return result
+
+
+def topological_sort(edge_map: Dict[str, Set[str]]) -> Iterator[EquivalenceClass]:
+    # Collapse every strongly connected component (a cycle, simple or interleaved) into a single node, which leaves a
+    # DAG we can layer by repeatedly removing the components whose dependencies have all been removed.
+    # Components that are a single node without a self-dependency are emitted together as one wave.
+    # When no such node is ready, the ready cycles are emitted one at a time, smallest member first.
+    # Everything is done in one pass over the edges, and edge_map is left untouched.
+    nodes = list(edge_map)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    for destinations in edge_map.values():
+        for dest in destinations:
+            if dest not in node_index:
+                node_index[dest] = len(nodes)
+                nodes.append(dest)
+    depends_on: List[List[int]] = [[] for _ in nodes]
+    for src, destinations in edge_map.items():
+        depends_on[node_index[src]] = [node_index[dest] for dest in destinations]
+
+    component = _strongly_connected_components(nodes, depends_on)
+    members: Dict[int, List[int]] = {}
+    for node, c in enumerate(component):
+        members.setdefault(c, []).append(node)
+
+    # Number of edges to other components not removed yet, and the reverse edges to update it
+    pending = dict.fromkeys(members, 0)
+    required_by: Dict[int, List[int]] = {c: [] for c in members}
+    cyclic = set()
+    for node, dependencies in enumerate(depends_on):
+        for dependency in dependencies:
+            if component[node] == component[dependency]:
+                cyclic.add(component[node])
+            else:
+                pending[component[node]] += 1
+                required_by[component[dependency]].append(component[node])
+
+    ready_nodes: List[int] = []
+    ready_cycles: List[tuple] = []
+
+    def mark_ready(c):
+        if c in cyclic:
+            heapq.heappush(ready_cycles, (min(nodes[node] for node in members[c]), c))
+        else:
+            ready_nodes.append(c)
+
+    def remove(c):
+        for dependent in required_by[c]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                mark_ready(dependent)
+
+    for c, count in pending.items():
+        if count == 0:
+            mark_ready(c)
+
+    while ready_nodes or ready_cycles:
+        if ready_nodes:
+            wave, ready_nodes = ready_nodes, []
+            for c in wave:
+                remove(c)
+            yield EquivalenceClass(members={nodes[members[c][0]] for c in wave}, cycle_edges={})
+        else:
+            _, c = heapq.heappop(ready_cycles)
+            remove(c)
+            cycle_nodes = {nodes[node] for node in members[c]}
+            # Only the edges within the component; everything else it depends on has already been emitted
+            cycle_edges = {
+                nodes[node]: {nodes[dependency] for dependency in depends_on[node] if component[dependency] == c}
+                for node in members[c]
+            }
+            yield EquivalenceClass(members=cycle_nodes, cycle_edges=cycle_edges)
 
 
-def _copy_edge_map(edge_map: Dict[str, Set[str]]) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
-    depends_on = {}
-    required_by = {}
+def critical_paths(edge_map: Dict[str, Set[str]], groups: List[EquivalenceClass],
+                   weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Length of the longest chain of nodes depending on each node, the node itself included, for groups in the order
+    topological_sort produced them. Nodes weigh 1 unless given in weights. The members of a cycle can only be done
+    together, so they all get the length of the whole cycle plus the longest chain depending on any of them.
+    """
+    weights = weights or {}
+    required_by: Dict[str, Set[str]] = {}
     for src, destinations in edge_map.items():
-        depends_on[src] = destinations
-        required_by.setdefault(src, set())
         for dest in destinations:
-            depends_on.setdefault(dest, set())
             required_by.setdefault(dest, set()).add(src)
-    return depends_on, required_by
-
-
-def _find_unreferenced(nodes: Set[str], depends_on: Dict[str, Set[str]]) -> Tuple[Set[str], Set[str]]:
-    unreferenced = {node for node in nodes if not depends_on.get(node)}
-    return unreferenced, nodes.difference(unreferenced)
-
-
-def _collect_dependencies(node: str, depends_on: Dict[str, Set[str]]) -> Set[str]:
-    cycle_nodes = {node}
-    to_add = depends_on[node]
-    while not to_add.issubset(cycle_nodes):
-        cycle_nodes.update(to_add)
-        to_add = {dependency for n in to_add for dependency in depends_on[n]}
-    return cycle_nodes
-
-
-def topological_sort(edge_map: Dict[str, Set[str]]) -> Iterable[EquivalenceClass]:
-    # Essential idea is to iteratively remove nodes without dependencies from the graph.
-    # Maintain a set of candidates which we partition into those which can and can't be removed.
-    # If we reach a point where no candidates are removable, then we've found at least one cycle.
-    # We can remove the cycle and resume.
-    # On removal, any node depending on one of the removed nodes becomes a potential candidate.
-    # Eventually, we will have removed all the nodes and are done.
-
-    # Maintain a forward map of dependencies (which tracks the current state of the graph)
-    # and a reverse map used to update the candidate set.
-    depends_on, required_by = _copy_edge_map(edge_map)
-
-    # Initially, all nodes without dependencies are candidates
-    # By definition, they are unblocked, so we don't need to partition them
-    candidates = {node for node, dependencies in depends_on.items() if not dependencies}
-    unblocked = candidates
-    blocked = set()
-
-    while unblocked or blocked:
-        if unblocked:
-            new_candidates = {child for node in unblocked for child in required_by[node]}
-            candidates = blocked.union(new_candidates)
-            # Remove dependency edges to unblocked nodes
-            for node in new_candidates:
-                depends_on[node].difference_update(unblocked)
-            yield EquivalenceClass(members=unblocked, cycle_edges={})
-        else:
-            # All remaining candidate nodes are involved in some cycle
-            # Choose one node and get all the nodes in the cycle.
-            # Because we've removed all (acyclic) dependencies, the dependencies remaining
-            # must be part of the cycle. So the reachable dependencies are the cycle
-            # (simple or complex).
-            cycle_nodes = _collect_dependencies(blocked.pop(), depends_on)
-
-            # All nodes requiring a node in the removed cycle are potential candidates for next wave
-            new_candidates = {child for node in cycle_nodes for child in required_by[node] if child not in cycle_nodes}
-            # Cycle may have involved additional nodes in blocked which can be removed now
-            candidates = blocked.difference(cycle_nodes).union(new_candidates)
-            # Remove dependency edges to cycle nodes
-            for node in new_candidates:
-                depends_on[node].difference_update(cycle_nodes)
-
-            # Get only the edges involving cycle nodes; this is the cycle (perhaps interleaving)
-            cycle_edges = {node: set(depends_on[node]) for node in cycle_nodes}
-            yield EquivalenceClass(members=cycle_nodes, cycle_edges=cycle_edges)
 
-        unblocked, blocked = _find_unreferenced(candidates, depends_on)
\ No newline at end of file
+    lengths: Dict[str, float] = {}
+    # Everything depending on a group comes after it, so walking the groups backwards sees the dependents first
+    for group in reversed(groups):
+        if group.cycle_edges:
+            downstream = max(
+                (lengths[dependent] for node in group.members for dependent in required_by.get(node, ())
+                 if dependent not in group.members),
+                default=0,
+            )
+            length = sum(weights.get(node, 1) for node in group.members) + downstream
+            lengths.update(dict.fromkeys(group.members, length))
+        else:
+            for node in group.members:
+                downstream = max((lengths[dependent] for dependent in required_by.get(node, ())), default=0)
+                lengths[node] = weights.get(node, 1) + downstream
+    return lengths
@@ -0,0 +1,201 @@
+# Version ordering and version range checks for conda package versions.
+# Every version is turned into a key of fixed shape once, so keys compare as plain tuples and the versions of a
+# package can be kept sorted and searched with bisect. Specs (">=1.2,<2|3.*") are compiled once into intervals of
+# such keys, which makes "does any version of this package satisfy the spec" a couple of binary searches.
+import bisect
+import functools
+import re
+from typing import List, Optional, Sequence, Tuple
+
+# The shape of every key: this many components of this many atoms each. Longer versions are cut off.
+COMPONENTS = 8
+ATOMS = 4
+
+# Atoms are (rank, number, string). Like conda, "dev" sorts first, then other strings, then numbers, then "post".
+_DEV = (0, 0, "")
+_ZERO = (2, 0, "")
+_POST = (3, 0, "")
+_MIN = (-1, 0, "")
+_MAX = (4, 0, "")
+
+_ATOM = re.compile(r"\d+|[a-z]+")
+_SEPARATORS = re.compile(r"[._-]")
+
+Key = Tuple[Tuple[int, int, str], ...]
+_KEY_LENGTH = 1 + COMPONENTS * ATOMS
+
+
+def _atom(text: str) -> Tuple[int, int, str]:
+    if text.isdigit():
+        return 2, int(text), ""
+    if text == "dev":
+        return _DEV
+    if text == "post":
+        return _POST
+    return 1, 0, text
+
+
+def _components(version: str) -> Tuple[int, List[List[Tuple[int, int, str]]]]:
+    version = version.strip().lower()
+    epoch = 0
+    if "!" in version:
+        epoch_text, _, version = version.partition("!")
+        epoch = int(epoch_text) if epoch_text.isdigit() else 0
+    # The local version label doesn't take part in the ordering
+    version = version.partition("+")[0]
+    components = []
+    for part in _SEPARATORS.split(version):
+        atoms = [_atom(atom) for atom in _ATOM.findall(part)]
+        if not atoms:
+            continue
+        # A component starting with a string is as if it started with 0, e.g. 1.0.rc1 is 1.0.0rc1
+        if atoms[0][0] != 2:
+            atoms.insert(0, _ZERO)
+        components.append(atoms[:ATOMS])
+    return epoch, components[:COMPONENTS]
+
+
+def _key(epoch: int, components: List[List[Tuple[int, int, str]]], fill=_ZERO) -> Key:
+    key = [(2, epoch, "")]
+    for component in components:
+        key.extend(component)
+        key.extend([_ZERO] * (ATOMS - len(component)))
+    key.extend([fill] * (_KEY_LENGTH - len(key)))
+    return tuple(key)
+
+
+@functools.lru_cache(maxsize=65536)
+def version_key(version: str) -> Key:
+    """Sortable key of a version; missing components count as 0, so 1.0 and 1.0.0 have the same key"""
+    return _key(*_components(version))
+
+
+def _prefix_bounds(version: str) -> Tuple[Key, Key]:
+    # Every key starting with the components of version, e.g. 1.2.* is everything from 1.2.dev up to 1.2.post
+    epoch, components = _components(version)
+    if not components:
+        return _key(epoch, [], _MIN), _key(epoch, [], _MAX)
+    # The last component is a prefix too, e.g. 1.2rc1 starts with 1.2, so it isn't padded with zeros
+    length = 1 + ATOMS * (len(components) - 1) + len(components[-1])
+    head = _key(epoch, components)[:length]
+    return head + (_MIN,) * (_KEY_LENGTH - length), head + (_MAX,) * (_KEY_LENGTH - length)
+
+
+class _Interval:
+    __slots__ = ("low", "low_inclusive", "high", "high_inclusive", "excluded")
+
+    def __init__(self):
+        self.low: Optional[Key] = None
+        self.low_inclusive = True
+        self.high: Optional[Key] = None
+        self.high_inclusive = True
+        # Inclusive (low, high) ranges of excluded keys, (key, key) for a single version
+        self.excluded: List[Tuple[Key, Key]] = []
+
+    def restrict_low(self, key: Key, inclusive: bool):
+        if self.low is None or key > self.low or (key == self.low and not inclusive):
+            self.low, self.low_inclusive = key, inclusive
+
+    def restrict_high(self, key: Key, inclusive: bool):
+        if self.high is None or key < self.high or (key == self.high and not inclusive):
+            self.high, self.high_inclusive = key, inclusive
+
+    def contains(self, key: Key) -> bool:
+        if self.low is not None and (key < self.low or (key == self.low and not self.low_inclusive)):
+            return False
+        if self.high is not None and (key > self.high or (key == self.high and not self.high_inclusive)):
+            return False
+        return not any(low <= key <= high for low, high in self.excluded)
+
+    def any_of(self, keys: Sequence[Key]) -> bool:
+        start = 0
+        if self.low is not None:
+            start = (bisect.bisect_left if self.low_inclusive else bisect.bisect_right)(keys, self.low)
+        end = len(keys)
+        if self.high is not None:
+            end = (bisect.bisect_right if self.high_inclusive else bisect.bisect_left)(keys, self.high)
+        if start >= end:
+            return False
+        # Whatever is in range only fails if all of it is excluded
+        covered = start
+        for low, high in sorted(self.excluded):
+            if bisect.bisect_left(keys, low, start, end) > covered:
+                return True
+            covered = max(covered, bisect.bisect_right(keys, high, start, end))
+        return covered < end
+
+
+_OPERATORS = ("~=", ">=", "<=", "!=", "==", ">", "<", "=")
+
+
+class VersionSpec:
+    """A compiled version spec: "|" separated alternatives of "," separated constraints"""
+
+    __slots__ = ("spec", "_intervals")
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        self._intervals: List[_Interval] = []
+        for alternative in spec.split("|"):
+            interval = _Interval()
+            for constraint in alternative.split(","):
+                constraint = constraint.strip()
+                if not constraint:
+                    continue
+                op = next((op for op in _OPERATORS if constraint.startswith(op)), "==")
+                version = constraint[len(op):].strip() if constraint.startswith(op) else constraint
+                if version == "*":
+                    continue
+                if op == "~=":
+                    # ~=1.2 is >=1.2,1.*
+                    interval.restrict_low(version_key(version), True)
+                    interval.restrict_high(_prefix_bounds(version.rpartition(".")[0])[1], True)
+                    continue
+                if version.endswith("*") and op not in ("==", "!=", "="):
+                    # Like conda, >=1.2.* is >=1.2
+                    version = version.rstrip("*").rstrip(".")
+                elif version.endswith("*") or (op == "=" and "*" not in version):
+                    # 1.2.* and =1.2 both mean any 1.2 version
+                    low, high = _prefix_bounds(version.rstrip("*").rstrip("."))
+                    if op == "!=":
+                        interval.excluded.append((low, high))
+                        continue
+                    interval.restrict_low(low, True)
+                    interval.restrict_high(high, True)
+                    continue
+                key = version_key(version)
+                if op == ">=":
+                    interval.restrict_low(key, True)
+                elif op == ">":
+                    interval.restrict_low(key, False)
+                elif op == "<=":
+                    interval.restrict_high(key, True)
+                elif op == "<":
+                    interval.restrict_high(key, False)
+                elif op == "!=":
+                    interval.excluded.append((key, key))
+                else:
+                    interval.restrict_low(key, True)
+                    interval.restrict_high(key, True)
+            self._intervals.append(interval)
+
+    def contains(self, version: str) -> bool:
+        if not self._intervals:
+            return True
+        key = version_key(version)
+        return any(interval.contains(key) for interval in self._intervals)
+
+    def any_of(self, sorted_keys: Sequence[Key]) -> bool:
+        """Whether any of the keys, which must be sorted, is in range"""
+        if not self._intervals:
+            return bool(sorted_keys)
+        return any(interval.any_of(sorted_keys) for interval in self._intervals)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_spec(spec: str) -> VersionSpec:
+    return VersionSpec(spec)
+
+
+def sorted_keys(versions: Sequence[str]) -> List[Key]:
+    return sorted(version_key(version) for version in versions)